@@ -2,6 +2,7 @@ from __future__ import annotations
 
 import ast
 import inspect
+import math
 import sys
 import tokenize
 from collections import defaultdict
@@ -21,6 +22,46 @@ def as_literal(p: Union[str, int, float, bool, None]) -> ast.Constant:
     return ast.Constant(value=p, kind=None)
 
 
+def _as_ast_parsed(p_var: Any) -> ast.AST:
+    "Convert a python constant to an ast by rendering it and parsing it back"
+    # If we are dealing with a string, we have to special case this.
+    if isinstance(p_var, str):
+        p_var = f"'{p_var}'"
+    a = ast.parse(str(p_var))
+
+    # Life out the thing inside the expression.
+    b = a.body[0]
+    assert isinstance(b, ast.Expr)
+    return b.value
+
+
+def _as_ast_int(p_var: int) -> ast.AST:
+    "Negative numbers are a unary minus applied to a constant in python's ast"
+    return as_literal(p_var) if not p_var < 0 else _as_ast_parsed(p_var)
+
+
+def _as_ast_float(p_var: float) -> ast.AST:
+    "As for integers, but `-0.0` also has a unary minus and `nan` and `inf` are names"
+    if math.isfinite(p_var) and math.copysign(1.0, p_var) > 0:
+        return as_literal(p_var)
+    return _as_ast_parsed(p_var)
+
+
+def _as_ast_list(p_var: List[Any]) -> ast.AST:
+    return ast.List(elts=[as_ast(e) for e in p_var], ctx=ast.Load())
+
+
+# Build the common (exact) types directly rather than round tripping through the parser.
+_as_ast_builders: Dict[type, Callable[[Any], ast.AST]] = {
+    str: as_literal,
+    int: _as_ast_int,
+    float: _as_ast_float,
+    bool: as_literal,
+    type(None): as_literal,
+    list: _as_ast_list,
+}
+
+
 def as_ast(p_var: Any) -> ast.AST:
     """Convert any python constant into an ast
 
@@ -33,16 +74,10 @@ def as_ast(p_var: Any) -> ast.AST:
         the result will be an AST node of type ast.List.
 
     """
-    # If we are dealing with a string, we have to special case this.
-    if isinstance(p_var, str):
-        p_var = f"'{p_var}'"
-    a = ast.parse(str(p_var))
-
-    # Life out the thing inside the expression.
-    # assert isinstance(a.body[0], ast.Expr)
-    b = a.body[0]
-    assert isinstance(b, ast.Expr)
-    return b.value
+    builder = _as_ast_builders.get(type(p_var))
+    if builder is not None:
+        return builder(p_var)
+    return _as_ast_parsed(p_var)
 
 
 def function_call(function_name: str, args: List[ast.AST]) -> ast.Call:
@@ -236,47 +271,44 @@ def lambda_assure(east: ast.AST, nargs: Optional[int] = None):
     return east
 
 
+def _lambda_or_none(lam: ast.AST) -> Optional[ast.Lambda]:
+    "Return the lambda `lam` is, or wraps as a one line module, or None if it is neither"
+    if type(lam) is ast.Module:
+        body = cast(ast.Module, lam).body
+        if len(body) != 1 or type(body[0]) is not ast.Expr:
+            return None
+        lam = cast(ast.Expr, body[0]).value
+    return cast(ast.Lambda, lam) if type(lam) is ast.Lambda else None
+
+
 def lambda_is_identity(lam: ast.AST) -> bool:
     "Return true if this is a lambda with 1 argument that returns the argument"
-    if not lambda_test(lam, 1):
+    rl = _lambda_or_none(lam)
+    if rl is None or len(rl.args.args) != 1:
         return False
 
-    b = lambda_unwrap(lam)
-    if not isinstance(b.body, ast.Name):
-        return False
-
-    a1 = b.args.args[0].arg
-    return a1 == b.body.id
+    b = rl.body
+    return type(b) is ast.Name and cast(ast.Name, b).id == rl.args.args[0].arg
 
 
 def lambda_is_true(lam: ast.AST) -> bool:
     "Return true if this lambda always returns true"
-    if not lambda_test(lam):
-        return False
-    rl = lambda_unwrap(lam)
-    if not isinstance(rl.body, ast.NameConstant):
+    rl = _lambda_or_none(lam)
+    if rl is None:
         return False
 
-    return rl.body.value is True
+    b = rl.body
+    return type(b) is ast.Constant and cast(ast.Constant, b).value is True
 
 
 def lambda_test(lam: ast.AST, nargs: Optional[int] = None) -> bool:
     r"""Test arguments"""
-    if not isinstance(lam, ast.Lambda):
-        if not isinstance(lam, ast.Module):
-            return False
-        if len(lam.body) != 1:
-            return False
-        if not isinstance(lam.body[0], ast.Expr):
-            return False
-        if not isinstance(cast(ast.Expr, lam.body[0]).value, ast.Lambda):
-            return False
-    rl = lambda_unwrap(lam) if type(lam) is ast.Module else lam
-    if type(rl) is not ast.Lambda:
+    rl = _lambda_or_none(lam)
+    if rl is None:
         return False
     if nargs is None:
         return True
-    return len(lambda_unwrap(lam).args.args) == nargs
+    return len(rl.args.args) == nargs
 
 
 def rewrite_func_as_lambda(f: ast.FunctionDef) -> ast.Lambda:
@@ -297,26 +329,27 @@ def rewrite_func_as_lambda(f: ast.FunctionDef) -> ast.Lambda:
         - It is assumed that the ast passed in won't be altered in place - no deep copy is
           done of the statement or args - they are just re-used.
     """
-    if len(f.body) != 1:
+    body = f.body
+    if len(body) != 1:
         raise ValueError(
-            f'Can handle simple functions of only one line - "{f.name}"' f" has {len(f.body)}."
+            f'Can handle simple functions of only one line - "{f.name}"' f" has {len(body)}."
         )
-    if not isinstance(f.body[0], ast.Return):
+    ret = body[0]
+    if type(ret) is not ast.Return:
         raise ValueError(
             f'Simple function must use return statement - "{f.name}" does ' "not seem to."
         )
+    if ret.value is None:
+        raise ValueError(f'Simple function must return a value - "{f.name}" has a bare return.')
 
-    # the arguments
-    args = f.args
-    ret = cast(ast.Return, f.body[0])
-    return ast.Lambda(args, ret.value)
+    return ast.Lambda(f.args, ret.value)
 
 
 class _rewrite_captured_vars(ast.NodeTransformer):
     def __init__(self, cv: inspect.ClosureVars):
         self._lookup_dict: Dict[str, Any] = dict(cv.nonlocals)
         self._lookup_dict.update(cv.globals)
-        self._ignore_stack = []
+        self._ignore_stack: List[List[str]] = []
 
     def visit_Name(self, node: ast.Name) -> Any:
         if self.is_arg(node.id):
@@ -338,7 +371,7 @@ class _rewrite_captured_vars(ast.NodeTransformer):
 
     def is_arg(self, a_name: str) -> bool:
         "If the arg is on the stack, then return true"
-        return any([a == a_name for frames in self._ignore_stack for a in frames])
+        return any(a_name in frame for frame in self._ignore_stack)
 
 
 def global_getclosurevars(f: Callable) -> inspect.ClosureVars:
@@ -372,11 +405,16 @@ def _realign_indent(s: str) -> str:
         str: Unindent string
     """
     lines = s.split("\n")
+    while len(lines) > 0 and lines[-1].strip() == "":
+        lines.pop()
+    if len(lines) == 0:
+        return ""
+
+    # Nothing to do for the common case of a function defined at module level.
     spaces = len(lines[0]) - len(lines[0].lstrip())
-    stripped_lines = [ln[spaces:] for ln in lines]
-    while len(stripped_lines) > 0 and stripped_lines[-1].strip() == "":
-        stripped_lines.pop()
-    return "\n".join(stripped_lines)
+    if spaces == 0:
+        return "\n".join(lines)
+    return "\n".join([ln[spaces:] for ln in lines])
 
 
 def _get_sourcelines(f: Callable) -> Tuple[List[str], int]:
@@ -552,6 +590,118 @@ def _get_lambda_in_stream(
     return lda, saw_new_line
 
 
+# Lambdas found by parsing a whole source file, indexed by the line they start on, along
+# with the name of the function they are an argument to, their argument names and their
+# source text. Keyed by file name, and kept with the source lines they came from so an
+# edited file (or notebook cell) is re-parsed. Only the most recent files are kept.
+_LambdaIndex = Dict[int, List[Tuple[Optional[str], List[str], str]]]
+_source_file_lambdas: Dict[str, Tuple[List[str], _LambdaIndex]] = {}
+_SOURCE_FILE_CACHE_SIZE = 64
+
+
+def _source_text(source: List[str], node: ast.expr) -> str:
+    """Cut the text of `node` out of the lines of the source it was parsed from. Like
+    `ast.get_source_segment`, but without splitting the whole file up again for each node.
+
+    Args:
+        source (List[str]): The lines of the file
+        node (ast.expr): A node parsed from those lines
+
+    Returns:
+        str: The source text of the node
+    """
+    first, last = node.lineno - 1, cast(int, node.end_lineno) - 1
+    start = source[first].encode()[node.col_offset :]
+    if first == last:
+        return start[: cast(int, node.end_col_offset) - node.col_offset].decode()
+    end = source[last].encode()[: node.end_col_offset]
+    return "".join([start.decode(), *source[first + 1 : last], end.decode()])
+
+
+def _index_source_lambdas(source: List[str]) -> _LambdaIndex:
+    """Parse a complete source file and index every lambda in it by starting line.
+
+    Args:
+        source (List[str]): The lines of the file
+
+    Returns:
+        _LambdaIndex: line number -> list of (caller name, argument names, lambda source).
+            Empty if the source can't be parsed.
+    """
+    try:
+        tree = ast.parse("".join(source))
+    except (SyntaxError, ValueError):
+        return {}
+
+    callers: Dict[int, str] = {}
+    for node in ast.walk(tree):
+        if type(node) is ast.Call:
+            call = cast(ast.Call, node)
+            if type(call.func) is ast.Attribute:
+                name = cast(ast.Attribute, call.func).attr
+            elif type(call.func) is ast.Name:
+                name = cast(ast.Name, call.func).id
+            else:
+                continue
+            for arg in call.args + [k.value for k in call.keywords]:
+                if type(arg) is ast.Lambda:
+                    callers[id(arg)] = name
+
+    index: _LambdaIndex = defaultdict(list)
+    for node in ast.walk(tree):
+        if type(node) is ast.Lambda:
+            lda = cast(ast.Lambda, node)
+            index[lda.lineno].append(
+                (callers.get(id(lda)), [a.arg for a in lda.args.args], _source_text(source, lda))
+            )
+    return index
+
+
+def _lambda_from_source_file(
+    f: Callable, source: List[str], caller_name: Optional[str]
+) -> Optional[ast.Lambda]:
+    """Find the lambda `f` in its source file by parsing the whole file (once per file).
+    This only succeeds if there is exactly one candidate - otherwise it is up to the
+    tokenizer scan to sort things out (and report errors).
+
+    Args:
+        f (Callable): The lambda
+        source (List[str]): The lines of the file `f` is defined in
+        caller_name (Optional[str]): The name of the function `f` is an argument to
+
+    Returns:
+        Optional[ast.Lambda]: A freshly parsed ast of the lambda, or None if it wasn't
+            uniquely found
+    """
+    code = getattr(f, "__code__", None)
+    if code is None or code.co_name != "<lambda>":
+        return None
+
+    cached = _source_file_lambdas.get(code.co_filename)
+    if cached is None or (cached[0] is not source and cached[0] != source):
+        if cached is None and len(_source_file_lambdas) >= _SOURCE_FILE_CACHE_SIZE:
+            del _source_file_lambdas[next(iter(_source_file_lambdas))]
+        cached = (source, _index_source_lambdas(source))
+        _source_file_lambdas[code.co_filename] = cached
+
+    arg_names = inspect.getfullargspec(f).args
+    candidates = [
+        text
+        for name, args, text in cached[1].get(code.co_firstlineno, [])
+        if (caller_name is None or name == caller_name) and args == arg_names
+    ]
+    if len(candidates) != 1:
+        return None
+
+    # The parentheses let a lambda that was split across lines inside a call parse alone.
+    # Should the text not come out as a lambda, leave it to the tokenizer scan.
+    try:
+        lda = ast.parse(f"({candidates[0]})", mode="eval").body
+    except SyntaxError:
+        return None
+    return cast(ast.Lambda, lda) if type(lda) is ast.Lambda else None
+
+
 def _parse_source_for_lambda(
     ast_source: Callable, caller_name: Optional[str] = None
 ) -> Optional[ast.Lambda]:
@@ -572,6 +722,12 @@ def _parse_source_for_lambda(
     func_name = None
     start_token = None
     source, lambda_line = _get_sourcelines(ast_source)
+
+    # Most of the time the lambda can be picked straight out of the parsed file
+    lda = _lambda_from_source_file(ast_source, source, caller_name)
+    if lda is not None:
+        return lda
+
     t_stream = None
     while func_name is None:
         # Setup the tokenizer
@@ -702,19 +858,36 @@ def scan_for_metadata(a: ast.AST, callback: Callable[[ast.arg], None]):
     to the call back.
     """
 
-    class metadata_finder(ast.NodeVisitor):
-        def visit_Call(self, node: ast.Call):
-            self.generic_visit(node)
+    # MetaData calls must be reported in the order they are applied: nested (inner) calls
+    # first. That is post-order, left to right - which is the reverse of a pre-order walk
+    # that takes children right to left, i.e. a plain stack with the children pushed in
+    # order. (`ast.walk` is breadth first, so it can't be used here).
+    found: List[ast.Call] = []
+    stack = [a]
+    while len(stack) > 0:
+        node = stack.pop()
+        if type(node) is ast.Call:
+            call = cast(ast.Call, node)
+            if type(call.func) is ast.Name and cast(ast.Name, call.func).id == "MetaData":
+                found.append(call)
+        stack.extend(ast.iter_child_nodes(node))
 
-            if isinstance(node.func, ast.Name) and node.func.id == "MetaData":
-                callback(node.args[1])  # type: ignore
-
-    metadata_finder().visit(a)
+    for c in reversed(found):
+        callback(cast(ast.arg, c.args[1]))
 
 
 g_legal_capture_types = (str, int, float, bool, complex, str, bytes, ModuleType)
 
 
+class _ConstantTypeChecker(ast.NodeVisitor):
+    "Raise a `ValueError` for any constant we do not know how to send over the wire"
+
+    def visit_Constant(self, node: ast.Constant):
+        if not isinstance(node.value, g_legal_capture_types):
+            raise ValueError(f"Invalid constant type: {type(node.value)} for {ast.dump(node)}")
+        self.generic_visit(node)
+
+
 def check_ast(a: ast.AST):
     """Check to make sure the ast does not have anything we can't send over the wire
     in `qastle` or similar.
@@ -725,13 +898,4 @@ def check_ast(a: ast.AST):
     Raises:
         ValueError: If something unsupported is found.
     """
-
-    class ConstantTypeChecker(ast.NodeVisitor):
-        def visit_Constant(self, node: ast.Constant):
-            if not isinstance(node.value, g_legal_capture_types):
-                raise ValueError(f"Invalid constant type: {type(node.value)} for {ast.dump(node)}")
-            self.generic_visit(node)
-
-    # Usage example:
-    checker = ConstantTypeChecker()
-    checker.visit(a)
+    _ConstantTypeChecker().visit(a)
@@ -1,7 +1,8 @@
 import inspect
 import sys
 import typing
-from typing import Any, Dict, Optional, Tuple, Type, TypeVar
+from functools import lru_cache
+from typing import Any, Callable, Dict, Optional, Tuple, Type, TypeVar
 
 if sys.version_info >= (3, 8):
     from typing import get_args, get_origin
@@ -16,8 +17,36 @@ else:  # pragma: no cover
         return getattr(tp, "__origin__", None)
 
 
+# The single-type helpers below are pure functions of a type, and are called over and
+# over with the same handful of types while following a query. Cache them.
+_TYPE_CACHE_SIZE = 1024
+
+
+@lru_cache(maxsize=_TYPE_CACHE_SIZE)
+def _cached_type_call(f: Callable[[Type], Any], t_id: int, t: Type) -> Any:
+    return f(t)
+
+
+def _type_cached(f: Callable[[Type], Any], t: Type) -> Any:
+    """Call `f(t)`, reusing the answer from the last call with this very type object.
+
+    Types are matched by identity as well as equality: `Union[int, str]` and
+    `Union[str, int]` compare equal, but an answer built from one should not be handed
+    back for the other. The key holds on to `t`, so its `id` can't be reused while it is
+    cached. Types that can't be hashed (e.g. `Annotated[int, {}]`) are not cached.
+    """
+    try:
+        return _cached_type_call(f, id(t), t)
+    except TypeError:
+        return f(t)
+
+
 def is_iterable(t: Type) -> bool:
     "Is this type iterable?"
+    return _type_cached(_is_iterable, t)
+
+
+def _is_iterable(t: Type) -> bool:
     while (t is not Any) and (not _is_iterable_direct(t)):
         t = get_inherited(t)
 
@@ -41,6 +70,10 @@ def get_inherited(t: Type) -> Type:
     Returns:
         Type: The type for an inherited class, or `Any` if none can be found
     """
+    return _type_cached(_get_inherited, t)
+
+
+def _get_inherited(t: Type) -> Type:
     if hasattr(t, "__orig_bases__"):
         base_classes = getattr(t, "__orig_bases__", None)
     elif hasattr(t, "__origin__") and hasattr(t.__origin__, "__orig_bases__"):
@@ -52,7 +85,7 @@ def get_inherited(t: Type) -> Type:
 
     g_args = get_args(t)
     if len(g_args) > 0:
-        mapping = {a.__name__: v for a, v in zip(r.__parameters__, g_args)}
+        mapping = dict(zip(r.__parameters__, g_args))
 
         r_base = get_origin(r)
         assert r_base is not None, "Internal error"
@@ -71,6 +104,10 @@ def get_inherited(t: Type) -> Type:
 
 def unwrap_iterable(t: Type) -> Type:
     "Unwrap an iterable type"
+    return _type_cached(_unwrap_iterable, t)
+
+
+def _unwrap_iterable(t: Type) -> Type:
     # Try to find an iterable in the history somehow
 
     while (t is not Any) and (not _is_iterable_direct(t)):
@@ -84,7 +121,7 @@ def unwrap_iterable(t: Type) -> Type:
     return a[0]
 
 
-def build_type_dict_from_type(t: Type, at_class: Optional[Type] = None) -> Dict[str, TypeVar]:
+def build_type_dict_from_type(t: Type, at_class: Optional[Type] = None) -> Dict[TypeVar, Type]:
     """Build a dictionary of type variables from a type
 
     Args:
@@ -93,9 +130,8 @@ def build_type_dict_from_type(t: Type, at_class: Optional[Type] = None) -> Dict[
                         if we can't find it, then fail badly.
 
     Returns:
-        Dict[str, Type]: The dictionary of type variables
+        Dict[TypeVar, Type]: The dictionary of type variables
     """
-    d = {}
     generic_type = get_origin(t)
     if generic_type is None:
         if at_class is not None:
@@ -108,12 +144,10 @@ def build_type_dict_from_type(t: Type, at_class: Optional[Type] = None) -> Dict[
         except TypeError as e:
             raise TypeError(f"Looked for generic parameters in {str(t)}") from e
 
-    for a in zip(generic_type.__parameters__, get_args(t)):
-        d[a[0].__name__] = a[1]
-    return d
+    return dict(zip(generic_type.__parameters__, get_args(t)))
 
 
-def _resolve_type(t: Type, parameters: Dict[str, Type]) -> Optional[Type]:
+def _resolve_type(t: Type, parameters: Dict[TypeVar, Type]) -> Optional[Type]:
     """Resolve any parameters in `t` with what we find in `parameters`
 
     int, {} => int
@@ -122,7 +156,8 @@ def _resolve_type(t: Type, parameters: Dict[str, Type]) -> Optional[Type]:
 
     Args:
         t (Type): The type to resolve
-        parameters (Dict[str, Type]): The dict of types to resolve
+        parameters (Dict[TypeVar, Type]): The dict of types to resolve, keyed by the
+            `TypeVar` itself (two different `TypeVar`s can share a name)
 
     Returns:
         None if `t` is parameterized by unknown type var's
@@ -130,13 +165,16 @@ def _resolve_type(t: Type, parameters: Dict[str, Type]) -> Optional[Type]:
         The type if no substitution is required.
     """
     if isinstance(t, TypeVar):
-        if t.__name__ in parameters:
-            return parameters[t.__name__]
-        return None
+        return parameters.get(t)
 
+    # `__parameters__` lists the free type variables however deeply they are nested
+    # (`Iterable[Iterable[T]]` has `(T,)`), so one substitution pass does the whole tree.
     template_params = getattr(t, "__parameters__", None)
     if template_params is not None and (len(template_params) > 0):
-        resolved_params = [_resolve_type(p, parameters) for p in template_params]
+        resolved_params = [
+            parameters.get(p) if isinstance(p, TypeVar) else _resolve_type(p, parameters)
+            for p in template_params
+        ]
         if None in resolved_params:
             return None
         return t[tuple(resolved_params)]
@@ -204,11 +242,12 @@ def get_method_and_class(class_object: Type, method_name: str) -> Optional[Tuple
         return None
 
     # Check for templated classes
-    # TODO: Use inspect.getmro
     if not hasattr(class_object, "__mro__"):
         class_object = get_origin(class_object)  # type: ignore
 
-    # Walk the resolution hierarchy to find the method
+    # Walk the resolution hierarchy to find the method. Each class is asked for it (rather
+    # than looking in its `__dict__`) - a classmethod is bound differently on each class,
+    # and then the class we started from is the one reported.
     found_obj = None
     found_method = None
     for c in inspect.getmro(class_object):
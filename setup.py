@@ -39,6 +39,7 @@ extras_require = {
         "pytest",
         "pytest-asyncio",
         "pytest-cov",
+        "pytest-timeout",
         "flake8",
         "coverage",
         "twine",
@@ -8,6 +8,7 @@ from func_adl.ast.func_adl_ast_utils import (
     change_extension_functions_to_calls,
     is_call_of,
 )
+from tests.util_debug_ast import assert_ast_equal
 
 
 class my_call_catcher(FuncADLNodeTransformer):
@@ -203,7 +204,7 @@ def test_extension_functions_call():
     expected = ast.parse("dude()")
 
     transform = change_extension_functions_to_calls(source)
-    assert ast.dump(transform) == ast.dump(expected)
+    assert_ast_equal(transform, expected)
 
 
 def test_extension_functions_select_call():
@@ -211,7 +212,7 @@ def test_extension_functions_select_call():
     expected = ast.parse("Select(jets, lambda b: b.pt())")
 
     transform = change_extension_functions_to_calls(source)
-    assert ast.dump(transform) == ast.dump(expected)
+    assert_ast_equal(transform, expected)
 
 
 def test_extension_functions_select_extension():
@@ -219,7 +220,7 @@ def test_extension_functions_select_extension():
     expected = ast.parse("Select(jets, lambda b: b.pt())")
 
     transform = change_extension_functions_to_calls(source)
-    assert ast.dump(transform) == ast.dump(expected)
+    assert_ast_equal(transform, expected)
 
 
 def test_extension_functions_select_extension_in_lambda_too():
@@ -227,4 +228,4 @@ def test_extension_functions_select_extension_in_lambda_too():
     expected = ast.parse("Select(jets, lambda b: Select(b, lambda j: jpt()))")
 
     transform = change_extension_functions_to_calls(source)
-    assert ast.dump(transform) == ast.dump(expected)
+    assert_ast_equal(transform, expected)
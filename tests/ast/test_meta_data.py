@@ -7,6 +7,7 @@ from func_adl.ast.meta_data import (
     lookup_query_metadata,
     remove_empty_metadata,
 )
+from tests.util_debug_ast import assert_ast_equal
 
 
 def compare_metadata(with_metadata: str, without_metadata: str) -> List[Dict[str, str]]:
@@ -19,7 +20,7 @@ def compare_metadata(with_metadata: str, without_metadata: str) -> List[Dict[str
 
     a_removed, metadata = extract_metadata(a_with)
 
-    assert ast.dump(a_removed) == ast.dump(a_without)
+    assert_ast_equal(a_removed, a_without)
     return metadata
 
 
@@ -2,7 +2,6 @@
 import ast
 import asyncio
 import logging
-from _ast import Call
 from enum import Enum
 from typing import Any, Iterable, Optional, Tuple, TypeVar
 
@@ -11,6 +10,7 @@ import pytest
 from func_adl import EventDataset
 from func_adl.object_stream import ObjectStream
 from func_adl.type_based_replacement import func_adl_callback
+from tests.util_debug_ast import assert_ast_equal
 
 
 class my_event(EventDataset):
@@ -96,7 +96,7 @@ def test_two_simple_query():
         .value()
     )
 
-    assert ast.dump(r1) == ast.dump(r2)
+    assert_ast_equal(r1, r2)
 
 
 def test_query_bad_variable():
@@ -174,7 +174,7 @@ def test_two_simple_query_parquet():
         .value()
     )
 
-    assert ast.dump(r1) == ast.dump(r2)
+    assert_ast_equal(r1, r2)
 
 
 def test_simple_query_panda():
@@ -203,7 +203,7 @@ def test_two_imple_query_panda():
         .AsPandasDF(["analysis"])
         .value()
     )
-    assert ast.dump(r1) == ast.dump(r2)
+    assert_ast_equal(r1, r2)
 
 
 def test_simple_query_awkward():
@@ -244,7 +244,7 @@ def test_two_similar_query_awkward():
         .value()
     )
 
-    assert ast.dump(r1) == ast.dump(r2)
+    assert_ast_equal(r1, r2)
 
 
 def test_metadata():
@@ -320,19 +320,16 @@ def test_query_metadata_not_empty():
     r_base = my_event().QMetaData({"one": "1"})
     q_ast = r_base.query_ast
 
-    class MDScanner(ast.NodeVisitor):
-        def visit_Call(self, node: Call) -> Any:
-            if not isinstance(node.func, ast.Name):
-                return self.generic_visit(node)
-            if node.func.id != "MetaData":
-                return self.generic_visit(node)
-            assert len(node.args) == 2
-            md_dict = node.args[1]
-            assert isinstance(md_dict, ast.Dict)
-            assert len(md_dict.keys) > 0
-            return self.generic_visit(node)
-
-    MDScanner().visit(q_ast)
+    md_calls = [
+        n
+        for n in ast.walk(q_ast)
+        if isinstance(n, ast.Call) and isinstance(n.func, ast.Name) and n.func.id == "MetaData"
+    ]
+    for node in md_calls:
+        assert len(node.args) == 2
+        md_dict = node.args[1]
+        assert isinstance(md_dict, ast.Dict)
+        assert len(md_dict.keys) > 0
 
 
 def test_nested_query_rendered_correctly():
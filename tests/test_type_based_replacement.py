@@ -17,6 +17,7 @@ from func_adl.type_based_replacement import (
     remap_from_lambda,
 )
 from func_adl.util_types import is_iterable, unwrap_iterable
+from tests.util_debug_ast import assert_ast_equal
 
 
 class Track:
@@ -258,8 +259,8 @@ def test_collection():
 
     new_objs, new_s, expr_type = remap_by_types(objs, "e", Event, s)
 
-    assert ast.dump(new_s) == ast.dump(ast_lambda("e.Jets('default')"))
-    assert ast.dump(new_objs.query_ast) == ast.dump(ast_lambda("MetaData(e, {'j': 'stuff'})"))
+    assert_ast_equal(new_s, ast_lambda("e.Jets('default')"))
+    assert_ast_equal(new_objs.query_ast, ast_lambda("MetaData(e, {'j': 'stuff'})"))
     assert expr_type == Iterable[Jet]
 
 
@@ -281,8 +282,8 @@ def test_collection_with_default():
 
     new_objs, new_s, expr_type = remap_by_types(objs, "e", Event, s)
 
-    assert ast.dump(new_s) == ast.dump(ast_lambda("e.Jets('default')"))
-    assert ast.dump(new_objs.query_ast) == ast.dump(ast_lambda("MetaData(e, {'j': 'stuff'})"))
+    assert_ast_equal(new_s, ast_lambda("e.Jets('default')"))
+    assert_ast_equal(new_objs.query_ast, ast_lambda("MetaData(e, {'j': 'stuff'})"))
     assert expr_type == Iterable[Jet]
 
 
@@ -295,12 +296,8 @@ def test_shortcut_nested_callback():
 
     new_objs, new_s, expr_type = remap_by_types(objs, "e", Event, s)
 
-    assert ast.dump(new_s) == ast.dump(
-        ast_lambda("e.TrackStuffs().Where(lambda t: abs(t.pt()) > 10)")
-    )
-    assert ast.dump(new_objs.query_ast) == ast.dump(
-        ast_lambda("MetaData(e, {'t': 'track stuff'})")
-    )
+    assert_ast_equal(new_s, ast_lambda("e.TrackStuffs().Where(lambda t: abs(t.pt()) > 10)"))
+    assert_ast_equal(new_objs.query_ast, ast_lambda("MetaData(e, {'t': 'track stuff'})"))
     assert expr_type == Iterable[TrackStuff]
 
 
@@ -315,15 +312,14 @@ def test_shortcut_2nested_callback():
 
     new_objs, new_s, expr_type = remap_by_types(objs, "ds", Iterable[Event], s)
 
-    assert ast.dump(new_s) == ast.dump(
+    assert_ast_equal(
+        new_s,
         ast_lambda(
             "ds.Select(lambda e: e.TrackStuffs())"
             ".Select(lambda ts: ts.Where(lambda t: t.pt() > 10))"
-        )
-    )
-    assert ast.dump(new_objs.query_ast) == ast.dump(
-        ast_lambda("MetaData(ds, {'t': 'track stuff'})")
+        ),
     )
+    assert_ast_equal(new_objs.query_ast, ast_lambda("MetaData(ds, {'t': 'track stuff'})"))
     assert expr_type == Iterable[Iterable[TrackStuff]]
 
 
@@ -417,7 +413,7 @@ def test_collection_Custom_Method_default(caplog):
     _, new_s, expr_type = remap_by_types(objs, "e", Event, s)
 
     assert expr_type == ObjectStream[Jet]
-    assert ast.dump(new_s) == ast.dump(ast_lambda("e.Jets('default').Take(5)"))
+    assert_ast_equal(new_s, ast_lambda("e.Jets('default').Take(5)"))
 
     assert len(caplog.text) == 0
 
@@ -651,9 +647,7 @@ def test_collection_Select_meta(caplog):
     new_objs, new_s, expr_type = remap_by_types(objs, "e", Event, s)
 
     assert expr_type == Iterable[float]
-    assert ast.dump(new_objs.query_ast) == ast.dump(
-        ast_lambda("MetaData(e, {'t': 'track stuff'})")
-    )
+    assert_ast_equal(new_objs.query_ast, ast_lambda("MetaData(e, {'t': 'track stuff'})"))
 
     assert len(caplog.text) == 0
 
@@ -665,8 +659,8 @@ def test_method_on_collection():
 
     new_objs, new_s, expr_type = remap_by_types(objs, "e", Event, s)
 
-    assert ast.dump(new_s) == ast.dump(ast_lambda("e.MET().pxy()"))
-    assert ast.dump(new_objs.query_ast) == ast.dump(ast_lambda("MetaData(e, {'j': 'pxy stuff'})"))
+    assert_ast_equal(new_s, ast_lambda("e.MET().pxy()"))
+    assert_ast_equal(new_objs.query_ast, ast_lambda("MetaData(e, {'j': 'pxy stuff'})"))
     assert expr_type == float
 
 
@@ -677,9 +671,10 @@ def test_method_callback():
 
     new_objs, new_s, expr_type = remap_by_types(objs, "e", Event, s)
 
-    assert ast.dump(new_s) == ast.dump(ast_lambda("e.MET().custom()"))
-    assert ast.dump(new_objs.query_ast) == ast.dump(
-        ast_lambda("MetaData(MetaData(e, {'j': 'pxy stuff'}), {'j': 'custom stuff'})")
+    assert_ast_equal(new_s, ast_lambda("e.MET().custom()"))
+    assert_ast_equal(
+        new_objs.query_ast,
+        ast_lambda("MetaData(MetaData(e, {'j': 'pxy stuff'}), {'j': 'custom stuff'})"),
     )
     assert expr_type == float
 
@@ -701,9 +696,10 @@ def test_method_on_method_on_collection():
 
     new_objs, new_s, expr_type = remap_by_types(objs, "e", Event, s)
 
-    assert ast.dump(new_s) == ast.dump(ast_lambda("e.MET().metobj().pxy()"))
-    assert ast.dump(new_objs.query_ast) == ast.dump(
-        ast_lambda("MetaData(MetaData(e, {'j': 'pxy stuff'}), {'j': 'pxyz stuff'})")
+    assert_ast_equal(new_s, ast_lambda("e.MET().metobj().pxy()"))
+    assert_ast_equal(
+        new_objs.query_ast,
+        ast_lambda("MetaData(MetaData(e, {'j': 'pxy stuff'}), {'j': 'pxyz stuff'})"),
     )
     assert expr_type == float
 
@@ -715,8 +711,8 @@ def test_method_modify_ast():
 
     new_objs, new_s, expr_type = remap_by_types(objs, "e", Event, s)
 
-    assert ast.dump(new_s) == ast.dump(ast_lambda("e.EventNumber(20)"))
-    assert ast.dump(new_objs.query_ast) == ast.dump(ast_lambda("e"))
+    assert_ast_equal(new_s, ast_lambda("e.EventNumber(20)"))
+    assert_ast_equal(new_objs.query_ast, ast_lambda("e"))
     assert expr_type == int
 
 
@@ -728,8 +724,8 @@ def test_method_with_no_return_type(caplog):
 
     new_objs, new_s, expr_type = remap_by_types(objs, "e", Event, s)
 
-    assert ast.dump(new_s) == ast.dump(ast_lambda("e.MET_noreturntype().pxy()"))
-    assert ast.dump(new_objs.query_ast) == ast.dump(ast_lambda("e"))
+    assert_ast_equal(new_s, ast_lambda("e.MET_noreturntype().pxy()"))
+    assert_ast_equal(new_objs.query_ast, ast_lambda("e"))
     assert expr_type == Any
     assert "MET_noreturntype" in caplog.text
 
@@ -742,8 +738,8 @@ def test_method_with_no_prototype(caplog):
 
     new_objs, new_s, expr_type = remap_by_types(objs, "e", Event, s)
 
-    assert ast.dump(new_s) == ast.dump(ast_lambda("e.MET_bogus().pxy()"))
-    assert ast.dump(new_objs.query_ast) == ast.dump(ast_lambda("e"))
+    assert_ast_equal(new_s, ast_lambda("e.MET_bogus().pxy()"))
+    assert_ast_equal(new_objs.query_ast, ast_lambda("e"))
     assert expr_type == Any
     assert "MET_bogus" in caplog.text
 
@@ -767,8 +763,8 @@ def test_method_with_no_inital_type(caplog):
 
     new_objs, new_s, expr_type = remap_by_types(objs, "e", Any, s)
 
-    assert ast.dump(new_s) == ast.dump(ast_lambda("e.MET_bogus().pxy()"))
-    assert ast.dump(new_objs.query_ast) == ast.dump(ast_lambda("e"))
+    assert_ast_equal(new_s, ast_lambda("e.MET_bogus().pxy()"))
+    assert_ast_equal(new_objs.query_ast, ast_lambda("e"))
     assert expr_type == Any
     assert len(caplog.text) == 0
 
@@ -780,8 +776,8 @@ def test_bogus_method():
 
     new_objs, new_s, expr_type = remap_by_types(objs, "e", Event, s)
 
-    assert ast.dump(new_s) == ast.dump(ast_lambda("e.Jetsss('default')"))
-    assert ast.dump(new_objs.query_ast) == ast.dump(ast_lambda("e"))
+    assert_ast_equal(new_s, ast_lambda("e.Jetsss('default')"))
+    assert_ast_equal(new_objs.query_ast, ast_lambda("e"))
     assert expr_type == Any
 
 
@@ -792,8 +788,8 @@ def test_plain_object_method():
 
     new_objs, new_s, expr_type = remap_by_types(objs, "j", Jet, s)
 
-    assert ast.dump(new_s) == ast.dump(ast_lambda("j.pt()"))
-    assert ast.dump(new_objs.query_ast) == ast.dump(ast_lambda("j"))
+    assert_ast_equal(new_s, ast_lambda("j.pt()"))
+    assert_ast_equal(new_objs.query_ast, ast_lambda("j"))
     assert expr_type == float
 
 
@@ -812,8 +808,8 @@ def test_function_with_processor():
 
     new_objs, new_s, expr_type = remap_by_types(objs, "e", Event, s)
 
-    assert ast.dump(new_s) == ast.dump(ast_lambda("MySqrt(2)"))
-    assert ast.dump(new_objs.query_ast) == ast.dump(ast_lambda("MetaData(e, {'j': 'func_stuff'})"))
+    assert_ast_equal(new_s, ast_lambda("MySqrt(2)"))
+    assert_ast_equal(new_objs.query_ast, ast_lambda("MetaData(e, {'j': 'func_stuff'})"))
     assert new_objs.item_type == Event
     assert expr_type == float
 
@@ -829,8 +825,8 @@ def test_function_with_simple():
 
     new_objs, new_s, expr_type = remap_by_types(objs, "e", Event, s)
 
-    assert ast.dump(new_s) == ast.dump(ast_lambda("MySqrt(2)"))
-    assert ast.dump(new_objs.query_ast) == ast.dump(ast_lambda("e"))
+    assert_ast_equal(new_s, ast_lambda("MySqrt(2)"))
+    assert_ast_equal(new_objs.query_ast, ast_lambda("e"))
     assert expr_type == float
 
 
@@ -860,8 +856,8 @@ def test_function_with_default():
 
     new_objs, new_s, expr_type = remap_by_types(objs, "e", Event, s)
 
-    assert ast.dump(new_s) == ast.dump(ast_lambda("MySqrt(20)"))
-    assert ast.dump(new_objs.query_ast) == ast.dump(ast_lambda("e"))
+    assert_ast_equal(new_s, ast_lambda("MySqrt(20)"))
+    assert_ast_equal(new_objs.query_ast, ast_lambda("e"))
     assert expr_type == float
 
 
@@ -876,10 +872,8 @@ def test_function_with_default_inside():
 
     new_objs, new_s, expr_type = remap_by_types(objs, "e", Event, s)
 
-    assert ast.dump(new_s) == ast.dump(
-        ast_lambda("e.Jets('default').Select(lambda j: MySqrt(20))")
-    )
-    assert ast.dump(new_objs.query_ast) == ast.dump(ast_lambda("MetaData(e, {'j': 'stuff'})"))
+    assert_ast_equal(new_s, ast_lambda("e.Jets('default').Select(lambda j: MySqrt(20))"))
+    assert_ast_equal(new_objs.query_ast, ast_lambda("MetaData(e, {'j': 'stuff'})"))
     assert expr_type == Iterable[float]
 
 
@@ -894,8 +888,8 @@ def test_function_with_keyword():
 
     new_objs, new_s, expr_type = remap_by_types(objs, "e", Event, s)
 
-    assert ast.dump(new_s) == ast.dump(ast_lambda("MySqrt(15)"))
-    assert ast.dump(new_objs.query_ast) == ast.dump(ast_lambda("e"))
+    assert_ast_equal(new_s, ast_lambda("MySqrt(15)"))
+    assert_ast_equal(new_objs.query_ast, ast_lambda("e"))
     assert expr_type == float
 
 
@@ -906,8 +900,8 @@ def test_remap_lambda_helper():
 
     new_objs, new_s, rtn_type = remap_from_lambda(objs, s)
 
-    assert ast.dump(new_s) == ast.dump(ast_lambda("lambda e: e.Jets('default')"))
-    assert ast.dump(new_objs.query_ast) == ast.dump(ast_lambda("MetaData(e, {'j': 'stuff'})"))
+    assert_ast_equal(new_s, ast_lambda("lambda e: e.Jets('default')"))
+    assert_ast_equal(new_objs.query_ast, ast_lambda("MetaData(e, {'j': 'stuff'})"))
     assert new_objs.item_type == Event
     assert rtn_type == Iterable[Jet]
 
@@ -924,8 +918,8 @@ def test_remap_lambda_subclass():
 
     new_objs, new_s, rtn_type = remap_from_lambda(objs, s)
 
-    assert ast.dump(new_s) == ast.dump(ast_lambda("lambda e: e.Jets('default')"))
-    assert ast.dump(new_objs.query_ast) == ast.dump(ast_lambda("MetaData(e, {'j': 'stuff'})"))
+    assert_ast_equal(new_s, ast_lambda("lambda e: e.Jets('default')"))
+    assert_ast_equal(new_objs.query_ast, ast_lambda("MetaData(e, {'j': 'stuff'})"))
     assert rtn_type == Iterable[Jet]
 
 
@@ -951,8 +945,8 @@ def test_index_callback_1arg():
 
     new_objs, new_s, expr_type = remap_by_types(objs, "e", TEvent, s)
 
-    assert ast.dump(new_s) == ast.dump(ast_lambda("e.info(55)"))
-    assert ast.dump(new_objs.query_ast) == ast.dump(ast_lambda("MetaData(e, {'k': 'stuff'})"))
+    assert_ast_equal(new_s, ast_lambda("e.info(55)"))
+    assert_ast_equal(new_objs.query_ast, ast_lambda("MetaData(e, {'k': 'stuff'})"))
     assert expr_type == float
     assert param_1_capture == "fork"
 
@@ -997,8 +991,8 @@ def test_index_callback_1arg_type():
 
     new_objs, new_s, expr_type = remap_by_types(objs, "e", TEvent, s)
 
-    assert ast.dump(new_s) == ast.dump(ast_lambda("e.info(55)"))
-    assert ast.dump(new_objs.query_ast) == ast.dump(ast_lambda("MetaData(e, {'k': 'stuff'})"))
+    assert_ast_equal(new_s, ast_lambda("e.info(55)"))
+    assert_ast_equal(new_objs.query_ast, ast_lambda("MetaData(e, {'k': 'stuff'})"))
     assert expr_type == float
     assert param_1_capture == int
 
@@ -1050,7 +1044,7 @@ def test_index_callback_modify_ast():
 
     _, new_s, _ = remap_by_types(objs, "e", TEvent, s)
 
-    assert ast.dump(new_s) == ast.dump(ast_lambda("e.dude(55)"))
+    assert_ast_equal(new_s, ast_lambda("e.dude(55)"))
 
 
 def test_index_callback_modify_ast_nested():
@@ -1078,7 +1072,7 @@ def test_index_callback_modify_ast_nested():
 
     _, new_s, _ = remap_by_types(objs, "e", TEvent, s)
 
-    assert ast.dump(new_s) == ast.dump(ast_lambda("e.Jets().Select(lambda j: j.dude(55))"))
+    assert_ast_equal(new_s, ast_lambda("e.Jets().Select(lambda j: j.dude(55))"))
 
 
 def test_index_callback_on_method():
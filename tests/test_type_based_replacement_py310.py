@@ -14,6 +14,7 @@ from func_adl.type_based_replacement import (
     remap_by_types,
     remap_from_lambda,
 )
+from tests.util_debug_ast import assert_ast_equal
 
 #
 # NOTE: Keep the tests here the same as in the file `test_type_based_replacement`.
@@ -264,8 +265,8 @@ def test_collection():
 
     new_objs, new_s, expr_type = remap_by_types(objs, "e", Event, s)
 
-    assert ast.dump(new_s) == ast.dump(ast_lambda("e.Jets('default')"))
-    assert ast.dump(new_objs.query_ast) == ast.dump(ast_lambda("MetaData(e, {'j': 'stuff'})"))
+    assert_ast_equal(new_s, ast_lambda("e.Jets('default')"))
+    assert_ast_equal(new_objs.query_ast, ast_lambda("MetaData(e, {'j': 'stuff'})"))
     assert expr_type == Iterable[Jet]
 
 
@@ -287,8 +288,8 @@ def test_collection_with_default():
 
     new_objs, new_s, expr_type = remap_by_types(objs, "e", Event, s)
 
-    assert ast.dump(new_s) == ast.dump(ast_lambda("e.Jets('default')"))
-    assert ast.dump(new_objs.query_ast) == ast.dump(ast_lambda("MetaData(e, {'j': 'stuff'})"))
+    assert_ast_equal(new_s, ast_lambda("e.Jets('default')"))
+    assert_ast_equal(new_objs.query_ast, ast_lambda("MetaData(e, {'j': 'stuff'})"))
     assert expr_type == Iterable[Jet]
 
 
@@ -303,15 +304,14 @@ def test_shortcut_2nested_callback():
 
     new_objs, new_s, expr_type = remap_by_types(objs, "ds", Iterable[Event], s)
 
-    assert ast.dump(new_s) == ast.dump(
+    assert_ast_equal(
+        new_s,
         ast_lambda(
             "ds.Select(lambda e: e.TrackStuffs())"
             ".Select(lambda ts: ts.Where(lambda t: t.pt() > 10))"
-        )
-    )
-    assert ast.dump(new_objs.query_ast) == ast.dump(
-        ast_lambda("MetaData(ds, {'t': 'track stuff'})")
+        ),
     )
+    assert_ast_equal(new_objs.query_ast, ast_lambda("MetaData(ds, {'t': 'track stuff'})"))
     assert expr_type == Iterable[Iterable[TrackStuff]]
 
 
@@ -344,14 +344,13 @@ def test_shortcut_nested_with_iterable_subclass():
 
     new_objs, new_s, expr_type = remap_by_types(objs, "ds", Iterable[MyEvent], s)
 
-    assert ast.dump(new_s) == ast.dump(
+    assert_ast_equal(
+        new_s,
         ast_lambda(
             "ds.Select(lambda e: e.MyTracks()).Select(lambda ts: ts.Select(lambda t: t.pt()))"
-        )
+        ),
     )
-    # assert ast.dump(new_objs.query_ast) == ast.dump(
-    #     ast_lambda("MetaData(e, {'t': 'track stuff'})")
-    # )
+    # assert_ast_equal(new_objs.query_ast, ast_lambda("MetaData(e, {'t': 'track stuff'})"))
     assert expr_type == Iterable[Iterable[float]]
 
 
@@ -362,8 +361,8 @@ def test_method_on_collection():
 
     new_objs, new_s, expr_type = remap_by_types(objs, "e", Event, s)
 
-    assert ast.dump(new_s) == ast.dump(ast_lambda("e.MET().pxy()"))
-    assert ast.dump(new_objs.query_ast) == ast.dump(ast_lambda("MetaData(e, {'j': 'pxy stuff'})"))
+    assert_ast_equal(new_s, ast_lambda("e.MET().pxy()"))
+    assert_ast_equal(new_objs.query_ast, ast_lambda("MetaData(e, {'j': 'pxy stuff'})"))
     assert expr_type == float
 
 
@@ -374,9 +373,10 @@ def test_method_callback():
 
     new_objs, new_s, expr_type = remap_by_types(objs, "e", Event, s)
 
-    assert ast.dump(new_s) == ast.dump(ast_lambda("e.MET().custom()"))
-    assert ast.dump(new_objs.query_ast) == ast.dump(
-        ast_lambda("MetaData(MetaData(e, {'j': 'pxy stuff'}), {'j': 'custom stuff'})")
+    assert_ast_equal(new_s, ast_lambda("e.MET().custom()"))
+    assert_ast_equal(
+        new_objs.query_ast,
+        ast_lambda("MetaData(MetaData(e, {'j': 'pxy stuff'}), {'j': 'custom stuff'})"),
     )
     assert expr_type == float
 
@@ -398,9 +398,10 @@ def test_method_on_method_on_collection():
 
     new_objs, new_s, expr_type = remap_by_types(objs, "e", Event, s)
 
-    assert ast.dump(new_s) == ast.dump(ast_lambda("e.MET().metobj().pxy()"))
-    assert ast.dump(new_objs.query_ast) == ast.dump(
-        ast_lambda("MetaData(MetaData(e, {'j': 'pxy stuff'}), {'j': 'pxyz stuff'})")
+    assert_ast_equal(new_s, ast_lambda("e.MET().metobj().pxy()"))
+    assert_ast_equal(
+        new_objs.query_ast,
+        ast_lambda("MetaData(MetaData(e, {'j': 'pxy stuff'}), {'j': 'pxyz stuff'})"),
     )
     assert expr_type == float
 
@@ -412,8 +413,8 @@ def test_method_modify_ast():
 
     new_objs, new_s, expr_type = remap_by_types(objs, "e", Event, s)
 
-    assert ast.dump(new_s) == ast.dump(ast_lambda("e.EventNumber(20)"))
-    assert ast.dump(new_objs.query_ast) == ast.dump(ast_lambda("e"))
+    assert_ast_equal(new_s, ast_lambda("e.EventNumber(20)"))
+    assert_ast_equal(new_objs.query_ast, ast_lambda("e"))
     assert expr_type == int
 
 
@@ -425,8 +426,8 @@ def test_method_with_no_return_type(caplog):
 
     new_objs, new_s, expr_type = remap_by_types(objs, "e", Event, s)
 
-    assert ast.dump(new_s) == ast.dump(ast_lambda("e.MET_noreturntype().pxy()"))
-    assert ast.dump(new_objs.query_ast) == ast.dump(ast_lambda("e"))
+    assert_ast_equal(new_s, ast_lambda("e.MET_noreturntype().pxy()"))
+    assert_ast_equal(new_objs.query_ast, ast_lambda("e"))
     assert expr_type == Any
     assert "MET_noreturntype" in caplog.text
 
@@ -439,8 +440,8 @@ def test_method_with_no_prototype(caplog):
 
     new_objs, new_s, expr_type = remap_by_types(objs, "e", Event, s)
 
-    assert ast.dump(new_s) == ast.dump(ast_lambda("e.MET_bogus().pxy()"))
-    assert ast.dump(new_objs.query_ast) == ast.dump(ast_lambda("e"))
+    assert_ast_equal(new_s, ast_lambda("e.MET_bogus().pxy()"))
+    assert_ast_equal(new_objs.query_ast, ast_lambda("e"))
     assert expr_type == Any
     assert "MET_bogus" in caplog.text
 
@@ -453,8 +454,8 @@ def test_method_with_no_inital_type(caplog):
 
     new_objs, new_s, expr_type = remap_by_types(objs, "e", Any, s)
 
-    assert ast.dump(new_s) == ast.dump(ast_lambda("e.MET_bogus().pxy()"))
-    assert ast.dump(new_objs.query_ast) == ast.dump(ast_lambda("e"))
+    assert_ast_equal(new_s, ast_lambda("e.MET_bogus().pxy()"))
+    assert_ast_equal(new_objs.query_ast, ast_lambda("e"))
     assert expr_type == Any
     assert len(caplog.text) == 0
 
@@ -466,8 +467,8 @@ def test_bogus_method():
 
     new_objs, new_s, expr_type = remap_by_types(objs, "e", Event, s)
 
-    assert ast.dump(new_s) == ast.dump(ast_lambda("e.Jetsss('default')"))
-    assert ast.dump(new_objs.query_ast) == ast.dump(ast_lambda("e"))
+    assert_ast_equal(new_s, ast_lambda("e.Jetsss('default')"))
+    assert_ast_equal(new_objs.query_ast, ast_lambda("e"))
     assert expr_type == Any
 
 
@@ -478,8 +479,8 @@ def test_plain_object_method():
 
     new_objs, new_s, expr_type = remap_by_types(objs, "j", Jet, s)
 
-    assert ast.dump(new_s) == ast.dump(ast_lambda("j.pt()"))
-    assert ast.dump(new_objs.query_ast) == ast.dump(ast_lambda("j"))
+    assert_ast_equal(new_s, ast_lambda("j.pt()"))
+    assert_ast_equal(new_objs.query_ast, ast_lambda("j"))
     assert expr_type == float
 
 
@@ -499,8 +500,8 @@ def test_function_with_processor():
 
     new_objs, new_s, expr_type = remap_by_types(objs, "e", Event, s)
 
-    assert ast.dump(new_s) == ast.dump(ast_lambda("MySqrt(2)"))
-    assert ast.dump(new_objs.query_ast) == ast.dump(ast_lambda("MetaData(e, {'j': 'func_stuff'})"))
+    assert_ast_equal(new_s, ast_lambda("MySqrt(2)"))
+    assert_ast_equal(new_objs.query_ast, ast_lambda("MetaData(e, {'j': 'func_stuff'})"))
     assert new_objs.item_type == Event
     assert expr_type == float
 
@@ -517,8 +518,8 @@ def test_function_with_simple():
 
     new_objs, new_s, expr_type = remap_by_types(objs, "e", Event, s)
 
-    assert ast.dump(new_s) == ast.dump(ast_lambda("MySqrt(2)"))
-    assert ast.dump(new_objs.query_ast) == ast.dump(ast_lambda("e"))
+    assert_ast_equal(new_s, ast_lambda("MySqrt(2)"))
+    assert_ast_equal(new_objs.query_ast, ast_lambda("e"))
     assert expr_type == float
 
 
@@ -550,8 +551,8 @@ def test_function_with_default():
 
     new_objs, new_s, expr_type = remap_by_types(objs, "e", Event, s)
 
-    assert ast.dump(new_s) == ast.dump(ast_lambda("MySqrt(20)"))
-    assert ast.dump(new_objs.query_ast) == ast.dump(ast_lambda("e"))
+    assert_ast_equal(new_s, ast_lambda("MySqrt(20)"))
+    assert_ast_equal(new_objs.query_ast, ast_lambda("e"))
     assert expr_type == float
 
 
@@ -567,8 +568,8 @@ def test_function_with_keyword():
 
     new_objs, new_s, expr_type = remap_by_types(objs, "e", Event, s)
 
-    assert ast.dump(new_s) == ast.dump(ast_lambda("MySqrt(15)"))
-    assert ast.dump(new_objs.query_ast) == ast.dump(ast_lambda("e"))
+    assert_ast_equal(new_s, ast_lambda("MySqrt(15)"))
+    assert_ast_equal(new_objs.query_ast, ast_lambda("e"))
     assert expr_type == float
 
 
@@ -579,8 +580,8 @@ def test_remap_lambda_helper():
 
     new_objs, new_s, rtn_type = remap_from_lambda(objs, s)
 
-    assert ast.dump(new_s) == ast.dump(ast_lambda("lambda e: e.Jets('default')"))
-    assert ast.dump(new_objs.query_ast) == ast.dump(ast_lambda("MetaData(e, {'j': 'stuff'})"))
+    assert_ast_equal(new_s, ast_lambda("lambda e: e.Jets('default')"))
+    assert_ast_equal(new_objs.query_ast, ast_lambda("MetaData(e, {'j': 'stuff'})"))
     assert new_objs.item_type == Event
     assert rtn_type == Iterable[Jet]
 
@@ -597,6 +598,6 @@ def test_remap_lambda_subclass():
 
     new_objs, new_s, rtn_type = remap_from_lambda(objs, s)
 
-    assert ast.dump(new_s) == ast.dump(ast_lambda("lambda e: e.Jets('default')"))
-    assert ast.dump(new_objs.query_ast) == ast.dump(ast_lambda("MetaData(e, {'j': 'stuff'})"))
+    assert_ast_equal(new_s, ast_lambda("lambda e: e.Jets('default')"))
+    assert_ast_equal(new_objs.query_ast, ast_lambda("MetaData(e, {'j': 'stuff'})"))
     assert rtn_type == Iterable[Jet]
@@ -1,15 +1,22 @@
 import ast
+import copy
+import linecache
 import sys
-from typing import Callable, cast
+import textwrap
+from functools import lru_cache
+from typing import Callable, List, cast
 
 import pytest
 
+from func_adl import util_ast
 from func_adl.util_ast import (
+    _index_source_lambdas,
     _realign_indent,
     as_ast,
     check_ast,
     function_call,
     lambda_args,
+    lambda_assure,
     lambda_body_replace,
     lambda_build,
     lambda_call,
@@ -22,109 +29,194 @@ from func_adl.util_ast import (
     scan_for_metadata,
 )
 from tests.test_type_based_replacement import replace_name_with_constant
+from tests.util_debug_ast import assert_ast_equal
 
 
-# Ast parsing
-def test_as_ast_integer():
-    if sys.version_info < (3, 8):
-        assert "Num(n=1)" == ast.dump(as_ast(1))
-    elif sys.version_info < (3, 9):
-        assert "Constant(value=1, kind=None)" == ast.dump(as_ast(1))
-    else:
-        assert "Constant(value=1)" == ast.dump(as_ast(1))
-
-
-def test_as_ast_string():
-    if sys.version_info < (3, 8):
-        assert "Str(s='hi there')" == ast.dump(as_ast("hi there"))
-    elif sys.version_info < (3, 9):
-        assert "Constant(value='hi there', kind=None)" == ast.dump(as_ast("hi there"))
-    else:
-        assert "Constant(value='hi there')" == ast.dump(as_ast("hi there"))
-
-
-def test_as_ast_string_var():
-    s = "hi there"
-    if sys.version_info < (3, 8):
-        assert "Str(s='hi there')" == ast.dump(as_ast(s))
-    elif sys.version_info < (3, 9):
-        assert "Constant(value='hi there', kind=None)" == ast.dump(as_ast(s))
-    else:
-        assert "Constant(value='hi there')" == ast.dump(as_ast(s))
-
-
-def test_as_ast_list():
-    if sys.version_info < (3, 8):
-        assert "List(elts=[Str(s='one'), Str(s='two')], ctx=Load())" == ast.dump(
-            as_ast(["one", "two"])
-        )
-    elif sys.version_info < (3, 9):
-        assert (
+@lru_cache(maxsize=None)
+def _p(src: str) -> ast.Module:
+    """Parse `src` as a module. The tree is shared between tests - a test that hands it to
+    something that may modify or keep hold of it must `copy.deepcopy` it first."""
+    return ast.parse(src)
+
+
+@lru_cache(maxsize=None)
+def _pe(src: str) -> ast.expr:
+    "Parse `src` as a single expression - shared in the same way as `_p`"
+    return cast(ast.Expression, ast.parse(src, mode="eval")).body
+
+
+def _exec_as_file(monkeypatch: pytest.MonkeyPatch, source: str, name: str, **namespace):
+    """Run `source` as if it were its own file (like a notebook cell), so `inspect` can
+    recover the source of the lambdas it creates. The file is gone again after the test."""
+    source = textwrap.dedent(source)
+    filename = f"<{name}>"
+    lines = source.splitlines(True)
+    monkeypatch.setitem(linecache.cache, filename, (len(source), None, lines, filename))
+    exec(compile(source, filename, "exec"), namespace)
+
+
+@pytest.fixture(params=["file_index", "tokenizer"])
+def lambda_finder(request, monkeypatch):
+    """Run a test once as things are, and once with the whole-file lambda index turned off,
+    so the tokenizer scan it usually short-circuits is tested as well."""
+    if request.param == "tokenizer":
+        monkeypatch.setattr("func_adl.util_ast._lambda_from_source_file", lambda *args: None)
+    return request.param
+
+
+class _Recorder:
+    """Stand-in for a query object: parses and records every lambda it is handed, the way
+    `ObjectStream` does."""
+
+    def __init__(self, found: List[ast.Lambda], caller_names: bool = False):
+        self._found = found
+        self._caller_names = caller_names
+
+    def _record(self, x: Callable, caller_name: str) -> "_Recorder":
+        self._found.append(parse_as_ast(x, caller_name if self._caller_names else None))
+        return self
+
+    def do_it(self, x: Callable, counter: int = 1) -> "_Recorder":
+        assert counter > 0
+        return self._record(x, "do_it")
+
+    def Where(self, x: Callable) -> "_Recorder":
+        return self._record(x, "Where")
+
+    def Select(self, x: Callable) -> "_Recorder":
+        return self._record(x, "Select")
+
+    def AsAwkwardArray(self, stuff: str) -> "_Recorder":
+        return self
+
+    def value(self) -> "_Recorder":
+        return self
+
+
+# Expected `ast.dump` output, which depends on the python version we are running on.
+if sys.version_info < (3, 9):
+    _EXPECTED_DUMP = {
+        "int": "Constant(value=1, kind=None)",
+        "str": "Constant(value='hi there', kind=None)",
+        "list": (
             "List(elts=[Constant(value='one', kind=None), Constant(value='two', "
-            "kind=None)], ctx=Load())" == ast.dump(as_ast(["one", "two"]))
-        )
-    else:
-        assert "List(elts=[Constant(value='one'), Constant(value='two')], ctx=Load())" == ast.dump(
-            as_ast(["one", "two"])
-        )
+            "kind=None)], ctx=Load())"
+        ),
+        "call": (
+            "Call(func=Name(id='dude', ctx=Load()), "
+            "args=[Constant(value=1, kind=None)], keywords=[])"
+        ),
+        "add_1": "op=Add(), right=Constant(value=1, kind=None))",
+    }
+else:
+    _EXPECTED_DUMP = {
+        "int": "Constant(value=1)",
+        "str": "Constant(value='hi there')",
+        "list": "List(elts=[Constant(value='one'), Constant(value='two')], ctx=Load())",
+        "call": "Call(func=Name(id='dude', ctx=Load()), args=[Constant(value=1)], keywords=[])",
+        "add_1": "op=Add(), right=Constant(value=1))",
+    }
+
+
+# Ast parsing
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        pytest.param(1, _EXPECTED_DUMP["int"], id="integer"),
+        pytest.param("hi there", _EXPECTED_DUMP["str"], id="string"),
+        pytest.param(["one", "two"], _EXPECTED_DUMP["list"], id="list"),
+    ],
+)
+def test_as_ast(value, expected: str):
+    assert expected == ast.dump(as_ast(value))
+
+
+@pytest.mark.parametrize(
+    "value",
+    [
+        pytest.param("it's", id="string_quote"),
+        pytest.param("C:\\temp\\file.root", id="string_backslash"),
+        pytest.param(-1, id="negative"),
+        pytest.param(2.5, id="float"),
+        pytest.param(None, id="none"),
+        pytest.param({"a": [1, -2], "b": True}, id="dict"),
+        pytest.param((1, "two"), id="tuple"),
+    ],
+)
+def test_as_ast_round_trip(value):
+    assert ast.literal_eval(as_ast(value)) == value
+
+
+def test_as_ast_negative_is_unary():
+    "Keep the same form python's parser generates"
+    assert type(as_ast(-1)) is ast.UnaryOp
+
+
+@pytest.mark.parametrize(
+    "value",
+    [
+        pytest.param(0.0, id="zero"),
+        pytest.param(-0.0, id="negative_zero"),
+        pytest.param(float("nan"), id="nan"),
+        pytest.param(float("inf"), id="inf"),
+        pytest.param(float("-inf"), id="negative_inf"),
+    ],
+)
+def test_as_ast_float_special(value: float):
+    "The same tree as parsing the float's text, as it has always been"
+    assert ast.dump(as_ast(value)) == ast.dump(ast.parse(str(value), mode="eval").body)
 
 
 # Fucntion Calling
 def test_function_call_simple():
     a = function_call("dude", [as_ast(1)])
-    print(ast.dump(ast.parse("dude(1)")))
-    if sys.version_info < (3, 8):
-        expected = "Call(func=Name(id='dude', ctx=Load()), args=[Num(n=1)], keywords=[])"
-    elif sys.version_info < (3, 9):
-        expected = (
-            "Call(func=Name(id='dude', ctx=Load()), "
-            "args=[Constant(value=1, kind=None)], keywords=[])"
-        )
-    else:
-        expected = "Call(func=Name(id='dude', ctx=Load()), args=[Constant(value=1)], keywords=[])"
-    assert expected == ast.dump(a)
+    assert _EXPECTED_DUMP["call"] == ast.dump(a)
 
 
 # Identity
 def test_identity_is():
-    assert lambda_is_identity(ast.parse("lambda x: x")) is True
+    assert lambda_is_identity(_pe("lambda x: x")) is True
 
 
 def test_identity_isnot_body():
-    assert lambda_is_identity(ast.parse("lambda x: x+1")) is False
+    assert lambda_is_identity(_pe("lambda x: x+1")) is False
 
 
 def test_identity_isnot_args():
-    assert lambda_is_identity(ast.parse("lambda x,y: x")) is False
+    assert lambda_is_identity(_pe("lambda x,y: x")) is False
 
 
 def test_identity_isnot_body_var():
-    assert lambda_is_identity(ast.parse("lambda x: x1")) is False
+    assert lambda_is_identity(_pe("lambda x: x1")) is False
+
+
+def test_identity_is_module():
+    assert lambda_is_identity(_p("lambda x: x")) is True
+
+
+def test_identity_isnot_two_statements():
+    assert lambda_is_identity(_p("lambda x: x\nlambda y: y")) is False
 
 
 # Is this a lambda?
 def test_lambda_test_expression():
-    assert lambda_test(ast.parse("x")) is False
+    assert lambda_test(_pe("x")) is False
 
 
 def test_lambda_assure_expression():
-    try:
-        lambda_test(ast.parse("x"))
-        assert False
-    except Exception:
-        pass
+    with pytest.raises(Exception, match="not a lambda"):
+        lambda_assure(_p("x"))
 
 
 def test_lambda_assure_lambda():
-    try:
-        lambda_test(ast.parse("lambda x : x+1"))
-        assert False
-    except Exception:
-        pass
+    a = _p("lambda x : x+1")
+    assert lambda_assure(a, 1) is a
+    with pytest.raises(Exception, match="right number of arguments"):
+        lambda_assure(a, 2)
 
 
 def test_lambda_args():
-    args = lambda_args(ast.parse("lambda x: x+1"))
+    args = lambda_args(_pe("lambda x: x+1"))
     assert len(args.args) == 1
     assert args.args[0].arg == "x"
 
@@ -134,104 +226,92 @@ def test_lambda_simple_ast_expr():
 
 
 def test_lambda_build_single_arg():
-    expr = ast.parse("x+1")
+    expr = copy.deepcopy(_p("x+1"))
     ln = lambda_build("x", expr)
-    assert isinstance(ln, ast.Lambda)
+    assert type(ln) is ast.Lambda
 
 
 def test_lambda_build_list_arg():
-    expr = ast.parse("x+1")
+    expr = copy.deepcopy(_p("x+1"))
     ln = lambda_build(["x"], expr)
-    assert isinstance(ln, ast.Lambda)
+    assert type(ln) is ast.Lambda
 
 
 def test_lambda_build_proper():
     "Make sure we are building the ast right for the version of python we are in"
-    expr = ast.parse("x+1").body[0].value  # type: ignore
+    expr = copy.deepcopy(_p("x+1").body[0].value)  # type: ignore
     ln = lambda_build("x", expr)
-    assert ast.dump(ast.parse("lambda x: x+1").body[0].value) == ast.dump(ln)  # type: ignore
+    assert_ast_equal(_p("lambda x: x+1").body[0].value, ln)  # type: ignore
 
 
 def test_call_wrap_list_arg():
-    ln = ast.parse("lambda x: x+1")
+    ln = copy.deepcopy(_p("lambda x: x+1"))
     c = lambda_call(["x"], ln)
-    assert isinstance(c, ast.Call)
+    assert type(c) is ast.Call
 
 
 def test_call_wrap_single_arg():
-    ln = ast.parse("lambda x: x+1")
+    ln = copy.deepcopy(_p("lambda x: x+1"))
     c = lambda_call("x", ln)
-    assert isinstance(c, ast.Call)
+    assert type(c) is ast.Call
 
 
 def test_lambda_test_lambda_module():
-    assert lambda_test(ast.parse("lambda x: x")) is True
+    assert lambda_test(_p("lambda x: x")) is True
 
 
 def test_lambda_test_raw_lambda():
-    rl = cast(ast.Expr, ast.parse("lambda x: x").body[0]).value
+    rl = cast(ast.Expr, _p("lambda x: x").body[0]).value
     assert lambda_test(rl) is True
 
 
 # Is this lambda always returning true?
 def test_lambda_is_true_yes():
-    assert lambda_is_true(ast.parse("lambda x: True")) is True
+    assert lambda_is_true(_pe("lambda x: True")) is True
 
 
 def test_lambda_is_true_no():
-    assert lambda_is_true(ast.parse("lambda x: False")) is False
+    assert lambda_is_true(_pe("lambda x: False")) is False
 
 
 def test_lambda_is_true_expression():
-    assert lambda_is_true(ast.parse("lambda x: x")) is False
+    assert lambda_is_true(_pe("lambda x: x")) is False
+
+
+def test_lambda_is_true_truthy_constant():
+    assert lambda_is_true(_pe("lambda x: 1")) is False
 
 
 def test_lambda_is_true_non_lambda():
-    assert lambda_is_true(ast.parse("True")) is False
+    assert lambda_is_true(_pe("True")) is False
 
 
 # Replacement
 def test_lambda_replace_simple_expression():
-    a1 = ast.parse("lambda x: x")
+    a1 = copy.deepcopy(_p("lambda x: x"))
 
-    nexpr = ast.parse("lambda y: y + 1")
+    nexpr = copy.deepcopy(_p("lambda y: y + 1"))
     expr = lambda_unwrap(nexpr).body
 
     a2 = lambda_body_replace(lambda_unwrap(a1), expr)
     a2_txt = ast.dump(a2)
-    if sys.version_info < (3, 8):
-        assert "op=Add(), right=Num(n=1))" in a2_txt
-    elif sys.version_info < (3, 9):
-        assert "op=Add(), right=Constant(value=1, kind=None))" in a2_txt
-    else:
-        assert "op=Add(), right=Constant(value=1))" in a2_txt
+    assert _EXPECTED_DUMP["add_1"] in a2_txt
 
 
 def test_rewrite_oneliner():
-    a = ast.parse(
-        """def oneline(a):
-        return a+1"""
-    )
-
-    b = a.body[0]
-    assert isinstance(b, ast.FunctionDef)
+    b = copy.deepcopy(_p("def oneline(a):\n    return a+1").body[0])
+    assert type(b) is ast.FunctionDef
     ln = rewrite_func_as_lambda(b)
 
-    assert isinstance(ln, ast.Lambda)
+    assert type(ln) is ast.Lambda
     assert len(ln.args.args) == 1
     assert ln.args.args[0].arg == "a"
-    assert isinstance(ln.body, ast.BinOp)
+    assert type(ln.body) is ast.BinOp
 
 
 def test_rewrite_twoliner():
-    a = ast.parse(
-        """def oneline(a):
-        t = a+1
-        return t"""
-    )
-
-    b = a.body[0]
-    assert isinstance(b, ast.FunctionDef)
+    b = _p("def oneline(a):\n    t = a+1\n    return t").body[0]
+    assert type(b) is ast.FunctionDef
     with pytest.raises(ValueError) as e:
         rewrite_func_as_lambda(b)
 
@@ -239,53 +319,53 @@ def test_rewrite_twoliner():
 
 
 def test_rewrite_noret():
-    a = ast.parse(
-        """def oneline(a):
-        a+1"""
-    )
-
-    b = a.body[0]
-    assert isinstance(b, ast.FunctionDef)
+    b = _p("def oneline(a):\n    a+1").body[0]
+    assert type(b) is ast.FunctionDef
     with pytest.raises(ValueError) as e:
         rewrite_func_as_lambda(b)
 
     assert "return" in str(e.value)
 
 
+def test_rewrite_bare_return():
+    b = _p("def oneline(a):\n    return").body[0]
+    assert type(b) is ast.FunctionDef
+    with pytest.raises(ValueError, match="return a value"):
+        rewrite_func_as_lambda(b)
+
+
 def test_parse_as_ast_lambda():
-    ln = lambda_unwrap(ast.parse("lambda x: x + 1"))
+    ln = lambda_unwrap(_p("lambda x: x+1"))
     r = parse_as_ast(ln)
-    assert isinstance(r, ast.Lambda)
+    assert type(r) is ast.Lambda
 
 
 def test_parse_as_str():
     r = parse_as_ast("lambda x: x + 1")
-    assert isinstance(r, ast.Lambda)
+    assert type(r) is ast.Lambda
 
 
 def test_parse_as_callable_simple():
     r = parse_as_ast(lambda x: x + 1)
-    assert isinstance(r, ast.Lambda)
+    assert type(r) is ast.Lambda
 
 
 def test_parse_nested_lambda():
     r = parse_as_ast(lambda x: (lambda y: y + 1)(x))
-    assert isinstance(r, ast.Lambda)
-    assert isinstance(r.body, ast.Call)
+    assert type(r) is ast.Lambda
+    assert type(r.body) is ast.Call
 
 
 def test_parse_lambda_capture():
     cut_value = 30
     r = parse_as_ast(lambda x: x > cut_value)
-    r_true = parse_as_ast(lambda x: x > 30)
-    assert ast.dump(r) == ast.dump(r_true)
+    assert_ast_equal(r, _pe("lambda x: x > 30"))
 
 
 def test_parse_lambda_capture_ignore_local():
     x = 30  # NOQA type: ignore
     r = parse_as_ast(lambda x: x > 20)
-    r_true = parse_as_ast(lambda y: y > 20)
-    assert ast.dump(r) == ast.dump(r_true).replace("'y'", "'x'")
+    assert_ast_equal(r, _pe("lambda x: x > 20"))
 
 
 g_cut_value = 30
@@ -294,21 +374,98 @@ g_cut_value = 30
 def test_parse_lambda_capture_ignore_global():
     x = 30  # NOQA type: ignore
     r = parse_as_ast(lambda g_cut_value: g_cut_value > 20)
-    r_true = parse_as_ast(lambda y: y > 20)
-    assert ast.dump(r) == ast.dump(r_true).replace("'y'", "'g_cut_value'")
+    assert_ast_equal(r, _pe("lambda g_cut_value: g_cut_value > 20"))
 
 
 def test_parse_lambda_capture_nested_global():
     r = parse_as_ast(lambda x: (lambda y: y > g_cut_value)(x))
-    r_true = parse_as_ast(lambda x: (lambda y: y > 30)(x))
-    assert ast.dump(r) == ast.dump(r_true)
+    assert_ast_equal(r, _pe("lambda x: (lambda y: y > 30)(x)"))
 
 
 def test_parse_lambda_capture_nested_local():
     cut_value = 30
     r = parse_as_ast(lambda x: (lambda y: y > cut_value)(x))
-    r_true = parse_as_ast(lambda x: (lambda y: y > 30)(x))
-    assert ast.dump(r) == ast.dump(r_true)
+    assert_ast_equal(r, _pe("lambda x: (lambda y: y > 30)(x)"))
+
+
+def test_parse_lambda_capture_same_code():
+    "Lambdas that share code but capture different values must each get their own value"
+    found = []
+
+    def select_cut(cut_value):
+        _Recorder(found).do_it(lambda x: x > cut_value)
+
+    select_cut(30)
+    select_cut(40)
+    assert_ast_equal(found[0], _pe("lambda x: x > 30"))
+    assert_ast_equal(found[1], _pe("lambda x: x > 40"))
+
+
+def test_parse_lambda_source_changed(request, monkeypatch):
+    "Re-running a changed cell under the same name must not find the old cell's lambda"
+    found = []
+    name = request.node.name
+    _exec_as_file(monkeypatch, "ds.do_it(lambda x: x + 1)\n", name, ds=_Recorder(found))
+    _exec_as_file(monkeypatch, "ds.do_it(lambda x: x * 2)\n", name, ds=_Recorder(found))
+
+    assert_ast_equal(found[0], _pe("lambda x: x + 1"))
+    assert_ast_equal(found[1], _pe("lambda x: x * 2"))
+
+
+def test_parse_lambda_same_line_args(request, monkeypatch):
+    "Pick out the right lambda when several on a line differ only by argument name"
+    found = []
+    _exec_as_file(
+        monkeypatch,
+        "ds.do_it(lambda x: x + 1).do_it(lambda y: y * 2)\n",
+        request.node.name,
+        ds=_Recorder(found, caller_names=True),
+    )
+
+    assert_ast_equal(found[0], _pe("lambda x: x + 1"))
+    assert_ast_equal(found[1], _pe("lambda y: y * 2"))
+
+
+def test_parse_lambda_file_does_not_parse(request, monkeypatch):
+    "A file that no longer parses as a whole still gives up its lambdas to the tokenizer"
+    found = []
+    source = "ds.do_it(lambda x: x + 1)\n"
+    filename = f"<{request.node.name}>"
+    lines = [source, "def broken(:\n"]
+    monkeypatch.setitem(linecache.cache, filename, (len("".join(lines)), None, lines, filename))
+    exec(compile(source, filename, "exec"), {"ds": _Recorder(found)})
+
+    assert _index_source_lambdas(lines) == {}
+    assert_ast_equal(found[0], _pe("lambda x: x + 1"))
+
+
+def test_parse_lambda_file_index_bounded(request, monkeypatch):
+    "Only the most recent files are indexed - notebook cells each get a new file name"
+    monkeypatch.setattr("func_adl.util_ast._SOURCE_FILE_CACHE_SIZE", 2)
+    monkeypatch.setattr("func_adl.util_ast._source_file_lambdas", {})
+    found = []
+    for i in range(3):
+        name = f"{request.node.name}-{i}"
+        _exec_as_file(monkeypatch, "ds.do_it(lambda x: x + 1)\n", name, ds=_Recorder(found))
+
+    assert list(util_ast._source_file_lambdas) == [
+        f"<{request.node.name}-1>",
+        f"<{request.node.name}-2>",
+    ]
+    assert len(found) == 3
+
+
+def test_parse_lambda_not_shared():
+    "Parsing the same lambda twice must hand back independent trees"
+    found = []
+
+    def select_it():
+        _Recorder(found).do_it(lambda x: x + 1)
+
+    select_it()
+    found[0].body = ast.Constant(value=0)
+    select_it()
+    assert type(found[1].body) is ast.BinOp
 
 
 def test_parse_simple_func():
@@ -319,9 +476,9 @@ def test_parse_simple_func():
 
     f = parse_as_ast(doit)
 
-    assert isinstance(f, ast.Lambda)
+    assert type(f) is ast.Lambda
     assert len(f.args.args) == 1
-    assert isinstance(f.body, ast.BinOp)
+    assert type(f.body) is ast.BinOp
 
 
 def global_doit(x):
@@ -333,9 +490,9 @@ def test_parse_global_simple_func():
 
     f = parse_as_ast(global_doit)
 
-    assert isinstance(f, ast.Lambda)
+    assert type(f) is ast.Lambda
     assert len(f.args.args) == 1
-    assert isinstance(f.body, ast.BinOp)
+    assert type(f.body) is ast.BinOp
 
 
 g_val = 50
@@ -345,15 +502,10 @@ def global_doit_capture(x):
     return x + g_val
 
 
-def global_doit_capture_true(x):
-    return x + 50
-
-
 def test_parse_global_capture():
     "Global function, which includes variable capture"
     f = parse_as_ast(global_doit_capture)
-    f_true = parse_as_ast(global_doit_capture_true)
-    assert ast.dump(f) == ast.dump(f_true)
+    assert_ast_equal(f, _pe("lambda x: x + 50"))
 
 
 def test_unknown_function():
@@ -365,13 +517,13 @@ def test_unknown_function():
 def test_known_local_function():
     "function that is declared locally"
 
-    def doit(x): ...
+    def doit(x): ...  # noqa
 
     f = parse_as_ast(lambda a: doit(a))  # type: ignore # NOQA
     assert "Name(id='doit'" in ast.dump(f)
 
 
-def global_doit_non_func(x): ...
+def global_doit_non_func(x): ...  # noqa
 
 
 def test_known_global_function():
@@ -385,22 +537,17 @@ def test_lambda_args_differentiation():
     "Use the arguments of the lambda to tell what we want"
     found = []
 
-    class my_obj:
-        def do_it(self, x: Callable):
-            found.append(parse_as_ast(x))
-            return self
-
-    (my_obj().do_it(lambda x: x + 1).do_it(lambda y: y * 2))
+    (_Recorder(found).do_it(lambda x: x + 1).do_it(lambda y: y * 2))
 
     assert len(found) == 2
     l1, l2 = found
-    assert isinstance(l1, ast.Lambda)
-    assert isinstance(l1.body, ast.BinOp)
-    assert isinstance(l1.body.op, ast.Add)
+    assert type(l1) is ast.Lambda
+    assert type(l1.body) is ast.BinOp
+    assert type(l1.body.op) is ast.Add
 
-    assert isinstance(l2, ast.Lambda)
-    assert isinstance(l2.body, ast.BinOp)
-    assert isinstance(l2.body.op, ast.Mult)
+    assert type(l2) is ast.Lambda
+    assert type(l2.body) is ast.BinOp
+    assert type(l2.body.op) is ast.Mult
 
 
 def test_lambda_method_differentiation():
@@ -425,13 +572,13 @@ def test_lambda_method_differentiation():
     l1 = found1[0]
     l2 = found2[0]
 
-    assert isinstance(l1, ast.Lambda)
-    assert isinstance(l1.body, ast.BinOp)
-    assert isinstance(l1.body.op, ast.Add)
+    assert type(l1) is ast.Lambda
+    assert type(l1.body) is ast.BinOp
+    assert type(l1.body.op) is ast.Add
 
-    assert isinstance(l2, ast.Lambda)
-    assert isinstance(l2.body, ast.BinOp)
-    assert isinstance(l2.body.op, ast.Mult)
+    assert type(l2) is ast.Lambda
+    assert type(l2.body) is ast.BinOp
+    assert type(l2.body.op) is ast.Mult
 
 
 # def test_parse_continues_accross_lines():
@@ -453,13 +600,13 @@ def test_lambda_method_differentiation():
 
 #     assert len(found) == 2
 #     l1, l2 = found
-#     assert isinstance(l1, ast.Lambda)
-#     assert isinstance(l1.body, ast.BinOp)
-#     assert isinstance(l1.body.op, ast.Add)
+#     assert type(l1) is ast.Lambda
+#     assert type(l1.body) is ast.BinOp
+#     assert type(l1.body.op) is ast.Add
 
-#     assert isinstance(l2, ast.Lambda)
-#     assert isinstance(l2.body, ast.BinOp)
-#     assert isinstance(l2.body.op, ast.Mult)
+#     assert type(l2) is ast.Lambda
+#     assert type(l2.body) is ast.BinOp
+#     assert type(l2.body.op) is ast.Mult
 
 
 def test_decorator_parse():
@@ -480,8 +627,8 @@ def test_decorator_parse():
 
     assert len(seen_lambdas) == 1
     l1 = seen_lambdas[0]
-    assert isinstance(l1.body, ast.BinOp)
-    assert isinstance(l1.body.op, ast.Add)
+    assert type(l1.body) is ast.BinOp
+    assert type(l1.body.op) is ast.Add
 
 
 def test_indent_parse():
@@ -500,12 +647,12 @@ def test_indent_parse():
 
     class yo_baby:
         @h.dec_func(lambda y: y + 2)
-        def doit(self, x: int): ...
+        def doit(self, x: int): ...  # noqa
 
     assert len(seen_funcs) == 1
     l1 = parse_as_ast(seen_funcs[0], "dec_func")
-    assert isinstance(l1.body, ast.BinOp)
-    assert isinstance(l1.body.op, ast.Add)
+    assert type(l1.body) is ast.BinOp
+    assert type(l1.body.op) is ast.Add
 
 
 def test_two_deep_parse():
@@ -523,150 +670,143 @@ def test_two_deep_parse():
 
     assert len(seen_lambdas) == 1
     l1 = seen_lambdas[0]
-    assert isinstance(l1.body, ast.BinOp)
-    assert isinstance(l1.body.op, ast.Add)
+    assert type(l1.body) is ast.BinOp
+    assert type(l1.body.op) is ast.Add
 
 
 def test_parse_continues_one_line():
     "Make sure we do not let our confusion confuse the user - bomb correctly here"
     found = []
 
-    class my_obj:
-        def do_it(self, x: Callable):
-            found.append(parse_as_ast(x))
-            return self
-
     with pytest.raises(Exception) as e:
-        my_obj().do_it(lambda x: x + 1).do_it(lambda x: x * 2)
+        _Recorder(found).do_it(lambda x: x + 1).do_it(lambda x: x * 2)
 
     assert "multiple" in str(e.value)
 
 
-def test_parse_space_after_method():
-    "Make sure we correctly parse a funnily formatted lambda"
-
-    found = []
-
-    class my_obj:
-        def do_it(self, x: Callable):
-            found.append(parse_as_ast(x))
-            return self
-
-    # fmt: off
-    my_obj().do_it   (lambda x: x + 123)  # noqa: E211
-    # fmt: on
-
-    assert "123" in ast.dump(found[0])
-
-
-def test_parse_multiline_bad_line_break():
-    "Make sure we correctly parse a funnily formatted lambda"
-
-    found = []
-
-    class my_obj:
-        def do_it(self, x: Callable):
-            found.append(parse_as_ast(x))
-            return self
-
-    # fmt: off
-    my_obj().do_it(
-        lambda x: x +  # noqa: W504
-        123)
-    # fmt: on
-
-    assert "123" in ast.dump(found[0])
-
-
-def test_parse_multiline_lambda_ok_with_one():
-    "Make sure we can properly parse a multi-line lambda"
-
-    found = []
-
-    class my_obj:
-        def do_it(self, x: Callable):
-            found.append(parse_as_ast(x))
-            return self
-
-    # fmt: off
-    my_obj().do_it(
-        lambda x: x
-        + 1  # noqa: W503
-        + 2  # noqa: W503
-        + 20  # noqa: W503
-    )
-    # fmt: on
-
-    assert "20" in ast.dump(found[0])
-
-
-def test_parse_multiline_lambda_same_line():
-    "Make sure we can properly parse a multi-line lambda"
-
-    found = []
-
-    class my_obj:
-        def do_it(self, x: Callable):
-            found.append(parse_as_ast(x))
-            return self
-
-    # fmt: off
-    my_obj().do_it(lambda x: x
-                   + 1  # noqa: W503
-                   + 2  # noqa: W503
-                   + 20  # noqa: W503
-                   )
-    # fmt: on
-
-    assert "20" in ast.dump(found[0])
-
-
-def test_parse_multiline_lambda_ok_with_one_and_paran():
-    "Make sure we can properly parse a multi-line lambda - using parens as delimiters"
+@pytest.mark.parametrize(
+    "source, expected",
+    [
+        pytest.param(
+            """
+            ds.do_it   (lambda x: x + 123)
+            """,
+            "123",
+            id="space_after_method",
+        ),
+        pytest.param(
+            """
+            ds.do_it(
+                lambda x: x +
+                123)
+            """,
+            "123",
+            id="bad_line_break",
+        ),
+        pytest.param(
+            """
+            ds.do_it(
+                lambda x: x
+                + 1
+                + 2
+                + 20
+            )
+            """,
+            "20",
+            id="ok_with_one",
+        ),
+        pytest.param(
+            """
+            ds.do_it(lambda x: x
+                     + 1
+                     + 2
+                     + 20
+                     )
+            """,
+            "20",
+            id="same_line",
+        ),
+        pytest.param(
+            """
+            ds.do_it(
+                lambda x: (
+                    x
+                    + 1
+                    + 2
+                    + 20
+                )
+            )
+            """,
+            "20",
+            id="ok_with_one_and_paran",
+        ),
+        pytest.param(
+            """
+            ds.do_it(
+                lambda x: x
+                + 1
+                + 2
+                + 20,
+                50,
+            )
+            """,
+            "20",
+            id="ok_with_one_as_arg",
+        ),
+        pytest.param(
+            """
+            ds.do_it(
+                lambda x: x  # the argument
+                + 123
+            )
+            """,
+            "123",
+            id="comment_inside",
+        ),
+        pytest.param(
+            """
+            def run():
+                ds.do_it(
+                    lambda x: x +
+                    123)
+
+
+            run()
+            """,
+            "123",
+            id="indented",
+        ),
+        pytest.param(
+            r"""
+            r = ds.Where(lambda e:
+                e.electron_pt.Where(lambda pT: pT > 25).Count() + e.muon_pt.Where(lambda pT: pT > 25).Count()== 1) \
+                .Where(lambda e:\
+                    e.jet_pt.Where(lambda pT: pT > 25).Count() >= 4
+                )     # a comment after the call
+            """,  # noqa: E501
+            "electron_pt",
+            id="with_comment",
+        ),
+    ],
+)
+def test_parse_multiline_lambda(source: str, expected: str, request, monkeypatch, lambda_finder):
+    "Make sure we can properly parse a lambda, however the call around it is wrapped"
 
     found = []
+    _exec_as_file(monkeypatch, source, request.node.name, ds=_Recorder(found))
 
-    class my_obj:
-        def do_it(self, x: Callable):
-            found.append(parse_as_ast(x))
-            return self
+    assert expected in ast.dump(found[0])
 
-    # fmt: off
-    my_obj().do_it(
-        lambda x: (
-            x
-            + 1  # noqa: W503
-            + 2  # noqa: W503
-            + 20  # noqa: W503
-        )
-    )
-    # fmt: on
-
-    assert "20" in ast.dump(found[0])
 
-
-def test_parse_multiline_lambda_blank_lines_no_infinite_loop():
-    "Make sure we can properly parse a multi-line lambda - using parens as delimiters"
+@pytest.mark.timeout(5)
+def test_parse_multiline_lambda_blank_lines_no_infinite_loop(lambda_finder):
+    """Make sure we can properly parse a multi-line lambda - using parens as delimiters.
+    The timeout turns a regression into the old infinite loop into a quick failure."""
 
     found = []
 
-    class my_obj:
-        def Where(self, x: Callable):
-            found.append(parse_as_ast(x))
-            return self
-
-        def Select(self, x: Callable):
-            found.append(parse_as_ast(x))
-            return self
-
-        def AsAwkwardArray(self, stuff: str):
-            return self
-
-        def value(self):
-            return self
-
     jets_pflow_name = "hi"
-    ds_dijet = my_obj()
+    ds_dijet = _Recorder(found)
 
     # fmt: off
     jets_pflow = (
@@ -686,23 +826,7 @@ def test_parse_select_where():
 
     found = []
 
-    class my_obj:
-        def Where(self, x: Callable):
-            found.append(parse_as_ast(x, "Where"))
-            return self
-
-        def Select(self, x: Callable):
-            found.append(parse_as_ast(x, "Select"))
-            return self
-
-        def AsAwkwardArray(self, stuff: str):
-            return self
-
-        def value(self):
-            return self
-
-    jets_pflow_name = "hi"
-    ds_dijet = my_obj()
+    ds_dijet = _Recorder(found, caller_names=True)
 
     # fmt: off
     jets_pflow = (
@@ -713,94 +837,27 @@ def test_parse_select_where():
     assert "met" in ast.dump(found[0])
 
 
-def test_parse_multiline_lambda_ok_with_one_as_arg():
-    "Make sure we can properly parse a multi-line lambda - but now with argument"
-
-    found = []
-
-    class my_obj:
-        def do_it(self, x: Callable, counter: int):
-            found.append(parse_as_ast(x))
-            assert counter > 0
-            return self
-
-    # fmt: off
-    my_obj().do_it(
-        lambda x: x
-        + 1  # noqa: W503
-        + 2  # noqa: W503
-        + 20,  # noqa: W503
-        50,
-    )
-    # fmt: on
-
-    assert "20" in ast.dump(found[0])
-
-
-def test_parse_multiline_lambda_with_funny_split():
+def test_parse_multiline_lambda_with_funny_split(lambda_finder):
     "This isn't on two lines but sort-of is - so we should parse it. See issue #84"
 
     found = []
 
-    class my_obj:
-        def do_it(self, x: Callable):
-            found.append(parse_as_ast(x))
-            return self
-
     # fmt: off
-    my_obj().do_it(lambda event: event + 1
-                   ).do_it(lambda event: event)
+    _Recorder(found).do_it(lambda event: event + 1
+                           ).do_it(lambda event: event)
     # fmt: on
 
     assert "Add()" in ast.dump(found[0])
     assert "Add()" not in ast.dump(found[1])
 
 
-def test_parse_multiline_lambda_with_comment():
-    "Comment in the middle of things"
-
-    found = []
-
-    class my_obj:
-        def Where(self, x: Callable):
-            found.append(parse_as_ast(x))
-            return self
-
-        def Select(self, x: Callable):
-            found.append(parse_as_ast(x))
-            return self
-
-        def AsAwkwardArray(self, stuff: str):
-            return self
-
-        def value(self):
-            return self
-
-    source = my_obj()
-    # fmt: off
-    # flake8: noqa
-    r = source.Where(lambda e:
-        e.electron_pt.Where(lambda pT: pT > 25).Count() + e.muon_pt.Where(lambda pT: pT > 25).Count()== 1) \
-        .Where(lambda e:\
-            e.jet_pt.Where(lambda pT: pT > 25).Count() >= 4
-        )     # noqa: E501
-    # fmt: on
-
-    assert "electron_pt" in ast.dump(found[0])
-
-
-def test_parse_black_split_lambda_funny():
+def test_parse_black_split_lambda_funny(lambda_finder):
     "Seen in wild - formatting really did a number here"
 
     found = []
 
-    class my_obj:
-        def do_it(self, x: Callable):
-            found.append(parse_as_ast(x))
-            return self
-
     # fmt: off
-    my_obj().do_it(
+    _Recorder(found).do_it(
         lambda e: e.Jets("AntiKt4EMTopoJets").do_it(
             lambda j: j.Jets("AntiKt4EMTopoJets").do_it(
                 lambda j1: j1.pt() / 1000.0
@@ -813,14 +870,14 @@ def test_parse_black_split_lambda_funny():
     assert "AntiKt4EMTopoJets" in ast.dump(found[0])
 
 
-def test_parse_paramertized_function_simple():
+def test_parse_paramertized_function_simple(lambda_finder):
     a = parse_as_ast(lambda e: e.jetAttribute["hi"](10))
     d_text = ast.dump(a)
     assert "Constant(value=10" in d_text
     assert "Constant(value='hi'" in d_text
 
 
-def test_parse_parameterized_function_type():
+def test_parse_parameterized_function_type(lambda_finder):
     a = parse_as_ast(lambda e: e.jetAttribute[int](10))
     d_text = ast.dump(a)
     assert "Constant(value=10" in d_text
@@ -829,7 +886,7 @@ def test_parse_parameterized_function_type():
     assert "Name(id='int'" in d_text
 
 
-def test_parse_parameterized_function_defined_type():
+def test_parse_parameterized_function_defined_type(lambda_finder):
     class my_type:
         bogus: int = 10
 
@@ -841,7 +898,7 @@ def test_parse_parameterized_function_defined_type():
     assert "Name(id='my_type'" in d_text
 
 
-def test_parse_parameterized_function_instance():
+def test_parse_parameterized_function_instance(lambda_finder):
     class my_type:
         def __init__(self, n):
             self._n = n
@@ -865,12 +922,35 @@ def test_parse_metadata_there():
         nonlocal recoreded
         recoreded = a
 
-    scan_for_metadata(ast.parse("MetaData(e, 22)"), callback)
+    scan_for_metadata(_p("MetaData(e, 22)"), callback)
 
     assert recoreded is not None
     assert 22 == ast.literal_eval(recoreded)
 
 
+def test_parse_metadata_nested_order():
+    recorded = []
+    scan_for_metadata(_p("MetaData(MetaData(e, 1).Select(lambda j: j), 2)"), recorded.append)
+
+    assert [ast.literal_eval(a) for a in recorded] == [1, 2]
+
+
+def test_parse_metadata_order_branches():
+    recorded = []
+    scan_for_metadata(
+        _p("MetaData(e.Select(lambda j: (MetaData(j, 1), MetaData(j, 2))), 3)"), recorded.append
+    )
+
+    assert [ast.literal_eval(a) for a in recorded] == [1, 2, 3]
+
+
+def test_parse_metadata_not_there():
+    recorded = []
+    scan_for_metadata(_p("e.Select(lambda j: Meta(j, 1))"), recorded.append)
+
+    assert recorded == []
+
+
 def test_realign_no_indent():
     assert _realign_indent("test") == "test"
 
@@ -891,8 +971,16 @@ def test_realign_indent_2lines_uneven():
     assert _realign_indent("    test()\n        dude()") == "test()\n    dude()"
 
 
+def test_realign_indent_trailing_blank_lines():
+    assert _realign_indent("    test()\n    dude()\n\n    \n") == "test()\ndude()"
+
+
+def test_realign_indent_blank():
+    assert _realign_indent("  \n\n") == ""
+
+
 def test_check_ast_good():
-    check_ast(ast.parse("1 + 2 + 'abc'"))
+    check_ast(_p("1 + 2 + 'abc'"))
 
 
 def test_check_ast_bad():
@@ -901,7 +989,7 @@ def test_check_ast_bad():
             self._n = n
 
     mt = my_type(10)
-    a = ast.parse("1 + 2 + abc")
+    a = copy.deepcopy(_p("1 + 2 + abc"))
     a = replace_name_with_constant(a, "abc", mt)
     with pytest.raises(ValueError) as e:
         check_ast(a)
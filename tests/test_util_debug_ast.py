@@ -0,0 +1,81 @@
+import ast
+import io
+
+from tests.util_debug_ast import pretty_print_visitor
+
+
+def _printed(node) -> str:
+    s = io.StringIO()
+    v = pretty_print_visitor(s)
+    v.visit(node)
+    v.flush()
+    return s.getvalue()
+
+
+def test_pretty_print_expression():
+    "The layout here is what the original recursive printer produced"
+    expected = "\n".join(
+        [
+            "BinOp(",
+            "    left=Call(",
+            '        func=Name(id="f"),',
+            "        args=list(",
+            "            [",
+            '                id="x",',
+            "                ctx=Load(),",
+            '                value="hi",',
+            "                kind=NoneType(),",
+            "                elts=list(",
+            "                    [",
+            '                        id="y",',
+            "                        ctx=Load(),",
+            "                    ]",
+            "                    ),",
+            "                ctx=Load(),",
+            "            ]",
+            "            ),",
+            "        keywords=list()        ),",
+            "    op=Add(),",
+            "    right=Num(n=1)    )",
+        ]
+    )
+    assert _printed(ast.parse('f(x, "hi", [y]) + 1', mode="eval").body) == expected
+
+
+def test_pretty_print_missing_fields():
+    "Fields that are not set are left out"
+    assert _printed(ast.Name(id="a")) == 'Name(id="a")'
+    assert _printed(ast.BinOp()) == "BinOp()"
+    assert _printed(ast.Call(func=ast.Name(id="f"))) == 'Call(\n    func=Name(id="f")    )'
+
+
+def test_pretty_print_only_on_flush():
+    s = io.StringIO()
+    v = pretty_print_visitor(s)
+    v.visit(ast.Name(id="a"))
+    assert s.getvalue() == ""
+
+    v.flush()
+    assert s.getvalue() == 'Name(id="a")'
+
+
+def test_pretty_print_visit_is_the_entry_point():
+    "The helpers that only queue work on the stack are not public"
+    v = pretty_print_visitor(io.StringIO())
+    assert not hasattr(v, "generic_visit")
+    assert not hasattr(v, "print_fields")
+    assert not hasattr(v, "visit_Constant")
+    assert _printed(ast.Constant(value="hi", kind=None)) == "\n".join(
+        ["Constant(", '    value="hi",', "    kind=NoneType()    )"]
+    )
+
+
+def test_pretty_print_deep_tree():
+    "Deeper than the recursion limit"
+    tree = ast.Name(id="a")
+    for _ in range(3000):
+        tree = ast.BinOp(left=tree, op=ast.Add(), right=ast.Name(id="a"))
+
+    text = _printed(tree)
+    assert text.startswith("BinOp(\n    left=BinOp(\n")
+    assert text.count("BinOp(") == 3000
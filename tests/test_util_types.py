@@ -1,8 +1,10 @@
-from typing import Any, Generic, Iterable, TypeVar
+import sys
+from typing import Any, Generic, Iterable, Tuple, TypeVar
 
 import pytest
 
 from func_adl.util_types import (
+    _cached_type_call,
     _resolve_type,
     build_type_dict_from_type,
     get_class_name,
@@ -13,6 +15,39 @@ from func_adl.util_types import (
     unwrap_iterable,
 )
 
+# Class hierarchies shared by the tests below (only their typing relationships matter)
+T = TypeVar("T")
+U = TypeVar("U")
+
+
+class bogus_iter_int(Iterable[int]):
+    def other_stuff(self):
+        return 5
+
+
+class bogus_iter_float(Iterable[float]):
+    pass
+
+
+class bogus_iter_t(Iterable[T]):
+    pass
+
+
+class bogus_iter_t_int(bogus_iter_t[int]):
+    pass
+
+
+class bogus_generic(Generic[T]):
+    pass
+
+
+class bogus_generic_iter(bogus_generic[Iterable[U]]):
+    pass
+
+
+class bogus_plain:
+    pass
+
 
 def test_is_iter_int():
     assert not is_iterable(int)
@@ -23,21 +58,11 @@ def test_is_iter_iter():
 
 
 def test_is_iter_inherited():
-    class bogus(Iterable[int]):
-        def other_stuff(self):
-            return 5
-
-    assert is_iterable(bogus)
+    assert is_iterable(bogus_iter_int)
 
 
 def test_is_iter_inherited_generic():
-    R = TypeVar("R")
-
-    class bogus(Iterable[R]):
-        def other_stuff(self):
-            return 5
-
-    assert is_iterable(bogus[int])
+    assert is_iterable(bogus_iter_t[int])
 
 
 def test_Any():
@@ -49,21 +74,11 @@ def test_iterable():
 
 
 def test_inherrited():
-    class bogus(Iterable[float]):
-        pass
-
-    assert unwrap_iterable(bogus) == float
+    assert unwrap_iterable(bogus_iter_float) == float
 
 
 def test_inherrited_generic():
-    T = TypeVar("T")
-
-    class bogus(Iterable[T]):
-        pass
-
-    myc = bogus[int]
-
-    assert unwrap_iterable(myc) == int
+    assert unwrap_iterable(bogus_iter_t[int]) == int
 
 
 def test_non_iterable():
@@ -71,10 +86,7 @@ def test_non_iterable():
 
 
 def test_non_iterable_obj():
-    class bogus:
-        pass
-
-    assert unwrap_iterable(bogus) == Any
+    assert unwrap_iterable(bogus_plain) == Any
 
 
 def test_get_inherited_int():
@@ -82,41 +94,40 @@ def test_get_inherited_int():
 
 
 def test_get_inherited_generic():
-    T = TypeVar("T")
+    assert get_inherited(bogus_iter_t[int]) == Iterable[int]  # type: ignore
 
-    class bogus(Iterable[T]):
-        pass
 
-    myc = bogus[int]
+def test_get_inherited_two_levels():
+    assert get_inherited(bogus_generic_iter[int]) == bogus_generic[Iterable[int]]
 
-    assert get_inherited(myc) == Iterable[int]  # type: ignore
 
+def test_get_inherited_cached():
+    "Uses its own classes so nothing else can have filled the cache first"
 
-def test_get_inherited_two_levels():
-    T = TypeVar("T")
-    U = TypeVar("U")
-
-    class bogus(Generic[T]):
+    class bogus_1(Generic[T]):
         pass
 
-    class bogus2(bogus[Iterable[U]]):
+    class bogus_2(bogus_1[int]):
         pass
 
-    myc = bogus2[int]
-    assert get_inherited(myc) == bogus[Iterable[int]]
+    hits = _cached_type_call.cache_info().hits
+    assert get_inherited(bogus_2) is get_inherited(bogus_2)
+    assert _cached_type_call.cache_info().hits == hits + 1
 
 
-def test_get_inherited_generic_twice():
-    T = TypeVar("T")
+@pytest.mark.skipif(sys.version_info < (3, 9), reason="Annotated arrived in python 3.9")
+def test_unhashable_type():
+    "Types that can't be hashed can't be cached, but still work"
+    from typing import Annotated
 
-    class bogus(Iterable[T]):
-        pass
+    assert is_iterable(Annotated[int, {}]) is False
+    assert unwrap_iterable(Annotated[int, {}]) is Any
+    assert get_inherited(Annotated[int, {}]) is Any
 
-    myc = bogus[int]
-    assert get_inherited(myc) == Iterable[int]  # type: ignore
 
-    myd = bogus[float]
-    assert get_inherited(myd) == Iterable[float]  # type: ignore
+def test_get_inherited_generic_twice():
+    assert get_inherited(bogus_iter_t[int]) == Iterable[int]  # type: ignore
+    assert get_inherited(bogus_iter_t[float]) == Iterable[float]  # type: ignore
 
 
 def test_build_type_int():
@@ -124,62 +135,24 @@ def test_build_type_int():
 
 
 def test_build_type_generic():
-    T = TypeVar("T")
-
-    class bogus(Iterable[T]):
-        pass
-
-    myc = bogus[int]
-
-    assert build_type_dict_from_type(myc) == {"T": int}
+    assert build_type_dict_from_type(bogus_iter_t[int]) == {T: int}
 
 
 def test_build_type_at_level():
-    T = TypeVar("T")
-    U = TypeVar("U")
-
-    class bogus(Generic[T]):
-        pass
-
-    class bogus_inher(bogus[Iterable[U]]):
-        pass
-
-    myc = bogus_inher[int]
-
-    assert build_type_dict_from_type(myc) == {"U": int}
+    assert build_type_dict_from_type(bogus_generic_iter[int]) == {U: int}
 
 
 def test_build_type_at_level_down_one():
-    T = TypeVar("T")
-    U = TypeVar("U")
+    myc = bogus_generic_iter[int]
 
-    class bogus(Generic[T]):
-        pass
-
-    class bogus_inher(bogus[Iterable[U]]):
-        pass
-
-    myc = bogus_inher[int]
-
-    assert build_type_dict_from_type(myc, at_class=bogus) == {"T": Iterable[int]}
+    assert build_type_dict_from_type(myc, at_class=bogus_generic) == {T: Iterable[int]}
 
 
 def test_build_type_at_level_down_one_reversed():
-    T = TypeVar("T")
-    U = TypeVar("U")
-
-    class bogus(Generic[T]):
-        pass
-
-    class bogus_inher(bogus[Iterable[U]]):
-        pass
-
-    myc = bogus[int]
-
     with pytest.raises(TypeError) as e:
-        build_type_dict_from_type(myc, at_class=bogus_inher)
+        build_type_dict_from_type(bogus_generic[int], at_class=bogus_generic_iter)
 
-    assert "bogus[" in str(e.value)
+    assert "bogus_generic[" in str(e.value)
 
 
 def test_resolve_type_int():
@@ -187,70 +160,54 @@ def test_resolve_type_int():
 
 
 def test_resolve_type_generic():
-    T = TypeVar("T")
-
-    assert _resolve_type(T, {"T": int}) == int
+    assert _resolve_type(T, {T: int}) == int
 
 
 def test_resolve_type_generic_filled():
-    assert _resolve_type(Iterable[int], {"T": int}) == Iterable[int]
+    assert _resolve_type(Iterable[int], {T: int}) == Iterable[int]
 
 
 def test_resolve_type_generic_not_found():
-    T = TypeVar("T")
-
     assert _resolve_type(T, {}) is None
 
 
 def test_resolve_type_nested():
-    T = TypeVar("T")
+    assert _resolve_type(Iterable[T], {T: int}) == Iterable[int]
 
-    assert _resolve_type(Iterable[T], {"T": int}) == Iterable[int]
 
-
-def test_resolve_type_nested_unknown():
+def test_resolve_type_nested_deep():
     K = TypeVar("K")
 
-    assert _resolve_type(Iterable[K], {"T": int}) is None
-
+    assert (
+        _resolve_type(Iterable[Tuple[T, Iterable[K]]], {T: int, K: float})
+        == Iterable[Tuple[int, Iterable[float]]]
+    )
 
-def test_resolve_type_vars():
-    T = TypeVar("T")
 
-    class bogus(Iterable[T]):
-        pass
+def test_resolve_type_nested_unknown():
+    K = TypeVar("K")
 
-    myc = bogus[int]
+    assert _resolve_type(Iterable[K], {T: int}) is None
 
-    assert resolve_type_vars(T, myc) == int
 
+def test_resolve_type_same_name():
+    "Type variables are matched by identity, not by name"
+    T1 = TypeVar("T")
+    T2 = TypeVar("T")
 
-def test_resolve_type_vars_with_no_match():
-    T = TypeVar("T")
+    assert _resolve_type(Iterable[T2], {T1: int}) is None
 
-    class bogus(Iterable[T]):
-        pass
 
-    class bogus_inher(bogus[int]):
-        pass
+def test_resolve_type_vars():
+    assert resolve_type_vars(T, bogus_iter_t[int]) == int
 
-    myc = bogus[int]
 
-    assert resolve_type_vars(int, myc, at_class=bogus_inher) == int
+def test_resolve_type_vars_with_no_match():
+    assert resolve_type_vars(int, bogus_iter_t[int], at_class=bogus_iter_t_int) == int
 
 
 def test_resolve_type_vars_not_there_no_match():
-    T = TypeVar("T")
-
-    class bogus(Iterable[T]):
-        pass
-
-    class bogus_inher(bogus[int]):
-        pass
-
-    myc = bogus[int]
-
-    assert resolve_type_vars(T, myc, at_class=bogus_inher) is None
+    assert resolve_type_vars(T, bogus_iter_t[int], at_class=bogus_iter_t_int) is None
 
 
 def test_get_name_simple():
@@ -269,10 +226,7 @@ def test_get_name_template():
 
 
 def test_get_method_and_class_not_there():
-    class bogus:
-        pass
-
-    assert get_method_and_class(bogus, "fork") is None
+    assert get_method_and_class(bogus_plain, "fork") is None
 
 
 def test_get_method_and_class_easy():
@@ -309,9 +263,38 @@ def test_get_method_and_class_inherrited_override():
     assert get_method_and_class(bogus_2, "fork") == (bogus_2, bogus_2.fork)
 
 
-def test_get_method_and_class_inherrited_template():
-    T = TypeVar("T")
+def test_get_method_and_class_inherrited_override_middle():
+    class bogus_1:
+        def fork(self):
+            pass
+
+    class bogus_2(bogus_1):
+        def fork(self):
+            pass
+
+    class bogus_3(bogus_2):
+        pass
+
+    assert get_method_and_class(bogus_3, "fork") == (bogus_2, bogus_2.fork)
 
+
+def test_get_method_and_class_inherrited_classmethod():
+    class bogus_1:
+        @classmethod
+        def fork(cls):
+            pass
+
+    class bogus_2(bogus_1):
+        pass
+
+    class bogus_3(bogus_2):
+        pass
+
+    # Bound to each class in turn, so it is reported on the class we asked about
+    assert get_method_and_class(bogus_3, "fork") == (bogus_3, bogus_3.fork)
+
+
+def test_get_method_and_class_inherrited_template():
     class bogus_1(Generic[T]):
         def fork(self) -> T:
             ...
@@ -1,76 +1,156 @@
 # Debug tools to help with AST's.
 import ast
+from collections import defaultdict
 from sys import stdout
 
+# Kinds of pending work on the pretty printer's stack
+_VISIT, _FIELDS, _WRITE = range(3)
 
-class pretty_print_visitor(ast.NodeVisitor):
+# Most pieces of output joined into a single write on flush
+_FLUSH_PARTS = 4096
+
+# Stands in for a field that is not set on a node
+_missing = object()
+
+# Every name normalize_ast rebuilds shares this context
+_load = ast.Load()
+
+
+class _Indents(dict):
+    "Indent strings by depth, each built the first time it is needed"
+
+    def __missing__(self, depth):
+        pad = self[depth] = "    " * depth
+        return pad
+
+
+_indents = _Indents()
+
+
+class pretty_print_visitor:
     r"""
     An AST pretty-printer. Mostly used during debugging and testing.
+
+    The tree is walked with an explicit stack of pending work rather than by recursion,
+    so very deep trees can be printed. Each entry is `(text, kind, item, indent)`: write
+    `text`, then visit `item` or print its fields (or nothing more, for `_WRITE`). Only
+    `visit` works the stack, so the helpers that push onto it are private.
+
+    Output is collected in memory and only written to the stream by `flush`.
     """
 
+    __slots__ = ("_s", "_parts", "_write", "_indent", "_stack")
+
     def __init__(self, stream):
         self._s = stream
+        self._parts = []
+        self._write = self._parts.append
         self._indent = 1
-
-    def print_fields(self, node):
+        self._stack = []
+
+    def visit(self, node):
+        "Print `node` and everything below it"
+        stack = self._stack
+        pop = stack.pop
+        write = self._write
+        dispatch = self._dispatch.get
+        generic_visit = type(self)._generic_visit
+        bottom = len(stack)
+        start_indent = self._indent
+        stack.append(("", _VISIT, node, start_indent))
+        while len(stack) > bottom:
+            text, kind, item, indent = pop()
+            write(text)
+            if kind != _WRITE:
+                self._indent = indent
+                if kind == _VISIT:
+                    dispatch(type(item), generic_visit)(self, item)
+                else:
+                    self._print_fields(item)
+        self._indent = start_indent
+
+    def flush(self):
+        "Write everything printed so far to the stream"
+        # Big trees go out a chunk at a time, so there is never a second copy of all of it
+        parts = self._parts
+        for start in range(0, len(parts), _FLUSH_PARTS):
+            self._s.write("".join(parts[start : start + _FLUSH_PARTS]))
+        parts.clear()
+
+    def _print_fields(self, node):
         "Handle different types of fields"
-        if isinstance(node, list):
-            self._s.write("    " * self._indent + "[\n")
-            self._indent += 1
-            for f in node:
-                self.print_fields(f)
-                self._s.write(",\n")
-            self._indent -= 1
-            self._s.write("    " * self._indent + "]\n")
+        indent = self._indent
+        pad = _indents[indent]
+        push = self._stack.append
+        if type(node) is list:
+            self._write(pad + "[\n")
+            # Every element, including the last, is followed by ",\n".
+            push(((",\n" if node else "") + pad + "]\n", _WRITE, None, indent))
+            for i in range(len(node) - 1, -1, -1):
+                push((",\n" if i > 0 else "", _FIELDS, node[i], indent + 1))
         elif isinstance(node, ast.AST):
-            first = True
-            for field, value in ast.iter_fields(node):
-                if not first:
-                    self._s.write(",\n")
-                first = False
-
-                self._s.write("    " * self._indent + field + "=")
-                self._indent += 1
-                self.visit(value)
-                self._indent -= 1
+            self._push_fields(node, indent)
         elif node is None:
             pass
         else:
-            self._s.write(str(node))
-
-    def count_fields(self, node):
-        "How many fields are there down a level?"
-        if isinstance(node, list):
-            return len(node)
-        elif isinstance(node, ast.AST):
-            return len(list(ast.iter_fields(node)))
-        elif node is None:
-            return 0
+            self._write(str(node))
+
+    def _push_fields(self, node, indent):
+        "Queue up each field set on `node`, returning False if there are none"
+        fields = [(name, getattr(node, name, _missing)) for name in node._fields]
+        fields = [(name, value) for name, value in fields if value is not _missing]
+        pad = _indents[indent]
+        push = self._stack.append
+        for i in range(len(fields) - 1, -1, -1):
+            name, value = fields[i]
+            push(((",\n" if i > 0 else "") + pad + name + "=", _VISIT, value, indent + 1))
+        return len(fields) > 0
+
+    def _generic_visit(self, node):
+        self._write(f"{type(node).__name__}(")
+        indent = self._indent
+        stack = self._stack
+        # The fields come off the stack first, then the close.
+        stack.append((_indents[indent] + ")", _WRITE, None, indent))
+        if isinstance(node, ast.AST):
+            has_fields = self._push_fields(node, indent)
+        elif type(node) is list and node:
+            stack.append(("", _FIELDS, node, indent))
+            has_fields = True
         else:
-            return 0
-
-    def generic_visit(self, node):
-        self._s.write(node.__class__.__name__)
-        self._s.write("(")
-        if self.count_fields(node) > 0:
-            self._s.write("\n")
-            self.print_fields(node)
-            self._s.write("    " * self._indent)
-        self._s.write(")")
+            has_fields = False
+        if has_fields:
+            self._write("\n")
+        else:
+            stack.pop()
+            self._write(")")
+
+    def _visit_Constant(self, node):
+        "Numbers print as `Num` (as `ast.NodeVisitor` routes them), other constants in full"
+        value = node.value
+        if isinstance(value, (int, float, complex)) and not isinstance(value, bool):
+            self.visit_Num(node)
+        else:
+            self._generic_visit(node)
 
     def visit_Num(self, node):
-        self._s.write("Num(n={0})".format(node.n))
+        self._write(f"Num(n={node.value})")
 
     def visit_str(self, node):
-        self._s.write('"{0}"'.format(node))
+        self._write(f'"{node}"')
 
     def visit_Name(self, node):
-        self._s.write('Name(id="{0}")'.format(node.id))
+        self._write(f'Name(id="{node.id}")')
+
+    # visit_* methods by the type of what they print. Everything else is generic.
+    _dispatch = {ast.Constant: _visit_Constant, ast.Name: visit_Name, str: visit_str}
 
 
 def pretty_print(ast):
     "Pretty print an ast"
-    pretty_print_visitor(stdout).visit(ast)
+    visitor = pretty_print_visitor(stdout)
+    visitor.visit(ast)
+    visitor.flush()
     stdout.write("\n")
 
 
@@ -83,40 +163,71 @@ class normalize_ast(ast.NodeTransformer):
 
     def __init__(self):
         self._arg_index = 0
-        self._arg_transformer = []
-
-    def push_stack_frame(self):
-        self._arg_transformer.append({})
+        # Each argument name maps to its new names, innermost lambda last. The lists are
+        # kept once empty, so a name seen before is re-bound without a new one.
+        self._bindings = defaultdict(list)
 
-    def pop_stack_frame(self):
-        del self._arg_transformer[-1]
+    def visit(self, node):
+        "Look up the visit_* by node type, rather than by `getattr` on its class name"
+        return self._dispatch.get(type(node), type(self).generic_visit)(self, node)
 
     def new_arg(self):
         "Generate a new argument, in a nice order"
         old_arg = self._arg_index
         self._arg_index += 1
-        return "t_arg_{0}".format(old_arg)
+        return f"t_arg_{old_arg}"
 
     def visit_Lambda(self, node: ast.Lambda) -> ast.Lambda:
         "Arguments need a uniform naming"
-        a_mapping = [(a.arg, self.new_arg()) for a in node.args.args]
+        old_names = [a.arg for a in node.args.args]
+        new_names = [self.new_arg() for _ in old_names]
 
         # Remap everything that is inside this guy
-        self.push_stack_frame()
-        for m in a_mapping:
-            self._arg_transformer[-1][m[0]] = m[1]
+        bindings = self._bindings
+        for old, new in zip(old_names, new_names):
+            bindings[old].append(new)
         body = self.visit(node.body)
-        self.pop_stack_frame()
+        for old in old_names:
+            bindings[old].pop()
 
         # Rebuild the lambda guy
-        args = [ast.arg(arg=m[1]) for m in a_mapping]
+        args = [ast.arg(arg=new) for new in new_names]
         return ast.Lambda(args=args, body=body)
 
     def lookup_name(self, name: str) -> str:
-        for frames in reversed(self._arg_transformer):
-            if name in frames:
-                return frames[name]
-        return name
+        renames = self._bindings.get(name)
+        return renames[-1] if renames else name
 
     def visit_Name(self, node: ast.Name):
-        return ast.Name(self.lookup_name(node.id), ast.Load())
+        "Rename lambda arguments - and make every name a load"
+        name = self.lookup_name(node.id)
+        if name == node.id and type(getattr(node, "ctx", None)) is ast.Load:
+            return node
+        return ast.Name(name, _load)
+
+    _dispatch = {ast.Lambda: visit_Lambda, ast.Name: visit_Name}
+
+
+def assert_ast_equal(a: ast.AST, b: ast.AST):
+    """Assert that two AST's are the same, ignoring source positions (the same test as
+    comparing their `ast.dump` strings). The trees are compared directly, stopping at the
+    first difference - the dumps are only built to report a failure.
+    """
+    stack = [(a, b)]
+    while stack:
+        x, y = stack.pop()
+        if type(x) is not type(y):
+            break
+        if isinstance(x, ast.AST):
+            stack.extend((getattr(x, f, None), getattr(y, f, None)) for f in x._fields)
+        elif isinstance(x, list):
+            if len(x) != len(y):
+                break
+            stack.extend(zip(x, y))
+        elif x != y:
+            break
+    else:
+        return
+
+    a_dump, b_dump = ast.dump(a), ast.dump(b)
+    assert a_dump == b_dump, f"AST's differ:\n  {a_dump}\n  {b_dump}"